@@ -0,0 +1,53 @@
+"""
+Benchmark for fetching a large query result with the "rows" versus "arrow" fetch modes of DbConnection.
+
+Peak memory is measured with tracemalloc, which covers the python objects built while fetching (arrow buffers are
+not included, but they hold the same values without boxing each one).
+
+Run from the repository root with: python -m benchmarks.bench_fetch_modes
+"""
+import os, time, sqlite3, tempfile, tracemalloc
+from unittest import mock
+from sqlalchemy import create_engine
+from squirrels import constants as c, manifest as mf
+from squirrels.db_conn import DbConnection
+
+ROW_COUNTS = [100_000, 1_000_000]
+
+
+def make_database(path: str, num_rows: int):
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE facts (id INTEGER, category TEXT, amount REAL)')
+        rows = ((i, f'category_{i % 100}', i * 0.5) for i in range(num_rows))
+        conn.executemany('INSERT INTO facts VALUES (?, ?, ?)', rows)
+
+
+def fetch(db_path: str, fetch_mode: str):
+    conn = DbConnection(None)
+    conn.engine = create_engine(f'sqlite:///{db_path}')
+    with mock.patch.object(mf, 'parms', {c.SETTINGS_KEY: {c.DB_FETCH_MODE_SETTING: fetch_mode}}):
+        start = time.perf_counter()
+        conn.get_dataframe_from_query('SELECT * FROM facts')
+        elapsed_ms = (time.perf_counter() - start) * 10**3
+
+        # Measured in a separate run, since tracemalloc slows down allocations
+        tracemalloc.start()
+        conn.get_dataframe_from_query('SELECT * FROM facts')
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed_ms, peak / 2**20
+
+
+def main():
+    print(f'{"rows":>10} {"mode":>6} {"time (ms)":>12} {"peak (MiB)":>12}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_rows in ROW_COUNTS:
+            db_path = os.path.join(tmp_dir, f'facts_{num_rows}.db')
+            make_database(db_path, num_rows)
+            for fetch_mode in [c.ROWS_FETCH_MODE, c.ARROW_FETCH_MODE]:
+                elapsed_ms, peak_mib = fetch(db_path, fetch_mode)
+                print(f'{num_rows:>10} {fetch_mode:>6} {elapsed_ms:>12.1f} {peak_mib:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
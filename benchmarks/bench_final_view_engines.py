@@ -0,0 +1,58 @@
+"""
+Benchmark for running a jinja sql final view with pandasql (sqlite) versus duckdb.
+
+Run from the repository root with: python -m benchmarks.bench_final_view_engines
+"""
+import time
+import numpy as np
+import pandas as pd
+from pandasql import sqldf
+import duckdb
+
+ROW_COUNTS = [10_000, 100_000, 1_000_000]
+FINAL_VIEW_SQL = """
+SELECT a.category, count(*) AS num_rows, avg(a.amount) AS avg_amount, max(b.weight) AS max_weight
+FROM view1 a JOIN view2 b ON a.category = b.category
+GROUP BY a.category
+"""
+
+
+def make_database_views(num_rows: int):
+    rng = np.random.default_rng(0)
+    view1 = pd.DataFrame({
+        'category': rng.integers(0, 100, num_rows),
+        'amount': rng.random(num_rows) * 1000,
+        'label': ['label_' + str(x) for x in range(num_rows)]
+    })
+    view2 = pd.DataFrame({'category': np.arange(100), 'weight': rng.random(100)})
+    return {'view1': view1, 'view2': view2}
+
+
+def run_sqlite(database_views):
+    return sqldf(FINAL_VIEW_SQL, env=database_views)
+
+
+def run_duckdb(database_views):
+    with duckdb.connect() as conn:
+        for view_name, df in database_views.items():
+            conn.register(view_name, df)
+        return conn.execute(FINAL_VIEW_SQL).df()
+
+
+def time_function(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 10**3
+
+
+def main():
+    print(f'{"rows":>10} {"sqlite (ms)":>15} {"duckdb (ms)":>15}')
+    for num_rows in ROW_COUNTS:
+        database_views = make_database_views(num_rows)
+        sqlite_ms = time_function(run_sqlite, database_views)
+        duckdb_ms = time_function(run_duckdb, database_views)
+        print(f'{num_rows:>10} {sqlite_ms:>15.1f} {duckdb_ms:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
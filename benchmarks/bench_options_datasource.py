@@ -0,0 +1,62 @@
+"""
+Benchmark for converting lookup tables into parameter options with OptionsDataSource.
+
+Run from the repository root with: python -m benchmarks.bench_options_datasource
+"""
+import time
+import numpy as np
+import pandas as pd
+import squirrels as sq
+
+ROW_COUNTS = [10_000, 100_000, 1_000_000]
+LEGACY_MAX_ROWS = 100_000
+
+
+def make_lookup_table(num_rows: int) -> pd.DataFrame:
+    ids = np.arange(num_rows)
+    parent_ids = pd.Series(ids % 100, dtype='float64')
+    parent_ids[::10] = np.nan
+    return pd.DataFrame({
+        'id': ids,
+        'options': ['option_' + str(x) for x in ids],
+        'ordering': ids[::-1],
+        'is_default': (ids % 1000 == 0).astype(int),
+        'parent_id': parent_ids,
+        'is_cond_default': (ids % 7 == 0).astype(int)
+    })
+
+
+def legacy_convert(df: pd.DataFrame):
+    """The original row-by-row conversion using DataFrame.iterrows, kept for comparison"""
+    def get_parent_id(row):
+        return str(row['parent_id']) if not pd.isnull(row['parent_id']) else None
+    
+    def is_cond_default(row):
+        return int(row['is_cond_default']) == 1 if not pd.isnull(row['is_cond_default']) else False
+    
+    df = df.sort_values('ordering')
+    options = [sq.ParameterOption(str(row['id']), str(row['options']), get_parent_id(row), is_cond_default(row)) for _, row in df.iterrows()]
+    default_ids = [str(x) for x in df.query('is_default == 1')['id'].values.tolist()]
+    return options, default_ids
+
+
+def time_function(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 10**3
+
+
+def main():
+    data_source = sq.OptionsDataSource('lu_table', 'id', 'options')
+    ds_param = sq.DataSourceParameter(sq.WidgetType.MultiSelect, 'Benchmark', data_source)
+
+    print(f'{"rows":>10} {"columnar (ms)":>15} {"iterrows (ms)":>15}')
+    for num_rows in ROW_COUNTS:
+        df = make_lookup_table(num_rows)
+        columnar_ms = time_function(data_source._convert, ds_param, df, True)
+        legacy_ms = f'{time_function(legacy_convert, df):.1f}' if num_rows <= LEGACY_MAX_ROWS else 'skipped'
+        print(f'{num_rows:>10} {columnar_ms:>15.1f} {legacy_ms:>15}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark of payload size and encode/decode time for the results API formats.
+
+Run from the repository root with: python -m benchmarks.bench_results_formats
+"""
+import io, json, time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from squirrels import constants as c
+from squirrels.api_server import encode_dataframe
+
+ROW_COUNTS = [10_000, 100_000, 1_000_000]
+
+
+def make_results(num_rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'ticker': rng.choice(['AAPL', 'AMZN', 'GOOG', 'MSFT'], num_rows),
+        'trading_date': pd.date_range('2000-01-01', periods=num_rows, freq='min').strftime('%Y-%m-%d %H:%M'),
+        'volume': rng.integers(0, 10**6, num_rows),
+        'avg_daily_return_bps': rng.normal(0, 100, num_rows)
+    })
+
+
+def encode_json(df: pd.DataFrame) -> bytes:
+    return json.dumps(json.loads(df.to_json(orient='table', index=False))).encode('utf-8')
+
+
+def decode_json(content: bytes) -> pd.DataFrame:
+    return pd.DataFrame(json.loads(content)['data'])
+
+
+def decode_arrow(content: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(content).read_pandas()
+
+
+def decode_parquet(content: bytes) -> pd.DataFrame:
+    return pd.read_parquet(io.BytesIO(content))
+
+
+def time_function(func, *args):
+    start = time.perf_counter()
+    output = func(*args)
+    return output, (time.perf_counter() - start) * 10**3
+
+
+def main():
+    formats = {
+        c.JSON_FORMAT: (encode_json, decode_json),
+        c.ARROW_FORMAT: (lambda df: encode_dataframe(df, c.ARROW_FORMAT), decode_arrow),
+        c.PARQUET_FORMAT: (lambda df: encode_dataframe(df, c.PARQUET_FORMAT), decode_parquet)
+    }
+    
+    print(f'{"rows":>10} {"format":>8} {"size (KB)":>12} {"encode (ms)":>12} {"decode (ms)":>12}')
+    for num_rows in ROW_COUNTS:
+        df = make_results(num_rows)
+        for format, (encode, decode) in formats.items():
+            content, encode_ms = time_function(encode, df)
+            _, decode_ms = time_function(decode, content)
+            print(f'{num_rows:>10} {format:>8} {len(content)/1024:>12.0f} {encode_ms:>12.1f} {decode_ms:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
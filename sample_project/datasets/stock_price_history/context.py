@@ -2,7 +2,7 @@ from typing import Dict, Any, Callable
 from datasets.stock_price_history.parameters import NumPeriodsParameter, TimeOfYearParameter, TimeUnitParameterOption
 import squirrels as sq
 
-def main(prms: Callable[[str], sq.Parameter]) -> Dict[str, Any]:
+def main(prms: Callable[[str], sq.Parameter], proj: Callable[[str], str]) -> Dict[str, Any]:
     time_unit_param: sq.SingleSelectParameter = prms('time_unit')
     reference_date_param: sq.DateParameter = prms('reference_date')
     num_periods_param: NumPeriodsParameter = prms('num_periods')
@@ -25,6 +25,11 @@ setup(
         'inquirer', 'pwinput', 'cachetools', 'fastapi', 'uvicorn', 'Jinja2', 
         'GitPython', 'pandasql', 'pandas', 'sqlalchemy<2', 'pyyaml'
     ],
+    extras_require={
+        'duckdb': ['duckdb'],
+        'arrow': ['pyarrow'],
+        'opentelemetry': ['opentelemetry-api']
+    },
     setup_requires=['pytest-runner==6.0.0'],
     tests_require=['pytest==7.2.0'],
     test_suite='tests',
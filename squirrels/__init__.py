@@ -1,6 +1,4 @@
-from squirrels.parameter_configs import ParameterOption, WidgetType, Parameter, ParameterSet
-from squirrels.parameter_configs import SingleSelectParameter, MultiSelectParameter, DateParameter, NumberParameter, RangeParameter, DataSourceParameter
-from squirrels.parameter_configs import OptionsDataSource, NumberDataSource, RangeDataSource, DateDataSource
+from typing import TYPE_CHECKING
 import os
 
 version_file = os.path.join(os.path.dirname(__file__), 'version.txt')
@@ -8,3 +6,27 @@ with open(version_file, 'r') as f:
     __version__ = f.read()
 
 major_version, minor_version, patch_version = __version__.split('.')
+
+# The parameter classes are imported on first use, so the CLI commands that don't need pandas or sqlalchemy start quickly
+_parameter_config_names = [
+    'ParameterOption', 'WidgetType', 'Parameter', 'ParameterSet',
+    'SingleSelectParameter', 'MultiSelectParameter', 'DateParameter', 'NumberParameter', 'RangeParameter', 'DataSourceParameter',
+    'OptionsDataSource', 'NumberDataSource', 'RangeDataSource', 'DateDataSource'
+]
+__all__ = _parameter_config_names + ['major_version', 'minor_version', 'patch_version']
+
+if TYPE_CHECKING:
+    from squirrels.parameter_configs import ParameterOption, WidgetType, Parameter, ParameterSet
+    from squirrels.parameter_configs import SingleSelectParameter, MultiSelectParameter, DateParameter, NumberParameter, RangeParameter, DataSourceParameter
+    from squirrels.parameter_configs import OptionsDataSource, NumberDataSource, RangeDataSource, DateDataSource
+
+
+def __getattr__(name: str):
+    if name in _parameter_config_names:
+        from squirrels import parameter_configs
+        return getattr(parameter_configs, name)
+    raise AttributeError(f'module "{__name__}" has no attribute "{name}"')
+
+
+def __dir__():
+    return list(globals()) + _parameter_config_names
@@ -1,15 +1,22 @@
-import json, os
-from typing import Dict, List, FrozenSet, Tuple
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+import os, time, asyncio, secrets, threading, importlib.util
+from functools import partial
+from typing import Dict, List, FrozenSet, Tuple, Iterator, AsyncIterator, Generator, Callable, NamedTuple, Optional, Any
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import Response, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from cachetools.func import ttl_cache
+from pandas import DataFrame
 
-from squirrels import major_version, constants as c, manifest as mf
-from squirrels.renderer import Renderer
+from squirrels import major_version, constants as c, manifest as mf, db_conn, executors, metrics, timer
+from squirrels.renderer import Renderer, refresh_parameters, get_parameters_version, clear_module_cache
+from squirrels.db_conn import DbConnection
+from squirrels.results_cache import ResultsCache, MemoryCache, create_results_cache
+from squirrels.single_flight import SingleFlight
 
 debug = False
+dataset_semaphores: Dict[str, asyncio.Semaphore] = {}
+results_single_flight = SingleFlight()
 
 
 def normalize_name(name: str):
@@ -20,14 +27,8 @@ def normalize_name_for_api(name: str):
 
 
 def load_selected_parameters(renderer: Renderer, query_params: FrozenSet[Tuple[str, str]]): # -> ParameterSet:
-    parameters = renderer.parameters
-    query_params_dict = dict(query_params)
-    for name, parameter in parameters._parameters_dict.items():
-        parameter.refresh(parameters)
-        selected_value = query_params_dict.get(name)
-        if selected_value is not None:
-            parameter.set_selection(selected_value)
-    return parameters
+    renderer.apply_selections(dict(query_params))
+    return renderer.parameters
 
 
 def load_dataframe(renderer: Renderer):
@@ -42,34 +43,294 @@ def load_dataframe(renderer: Renderer):
     return df
 
 
-def template_function(dataset: str, request: Request, helper_func):
+def get_dataset_semaphore(dataset: str) -> asyncio.Semaphore:
+    if dataset not in dataset_semaphores:
+        max_concurrency = mf.get_dataset_setting(dataset, c.RESULTS_MAX_CONCURRENCY_SETTING, 4)
+        dataset_semaphores[dataset] = asyncio.Semaphore(max_concurrency)
+    return dataset_semaphores[dataset]
+
+
+async def run_in_executor(helper_func: Callable[..., Any], *args) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executors.get_executor(c.API_EXECUTOR), helper_func, *args)
+
+
+async def run_with_dataset_limit(helper_func: Callable[..., Any], dataset: str, *args) -> Any:
+    async with get_dataset_semaphore(dataset):
+        return await run_in_executor(helper_func, dataset, *args)
+
+
+class DatasetLimitedStreamingResponse(StreamingResponse):
+    _end_of_stream = object()
+
+    def __init__(self, chunks: Generator[str, None, None], semaphore: asyncio.Semaphore, media_type: str):
+        """
+        Constructor for DatasetLimitedStreamingResponse, a streaming response that produces its chunks in one task of the 
+        API executor and releases an already acquired slot of the dataset's concurrency limit once the stream ends (or the 
+        client disconnects). Rows can be fetched from the database lazily while streaming, so the slot is held until then.
+
+        Args:
+            chunks (Generator[str, None, None]): The chunks of the response body
+            semaphore (asyncio.Semaphore): The acquired semaphore of the dataset
+            media_type (str): The media type of the response
+        """
+        self.chunks = chunks
+        self.semaphore = semaphore
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+        self._producing = False
+        self._stopped = threading.Event()
+        super().__init__(self.iterate_chunks(), media_type=media_type)
+    
+    def produce_chunks(self, loop: asyncio.AbstractEventLoop):
+        # The whole generator runs on one thread, since a database connection (e.g. for sqlite) can be tied to the thread
+        # that opened it. It is also closed there, which returns the connection to the pool
+        def put(item: Any):
+            asyncio.run_coroutine_threadsafe(self._queue.put(item), loop).result()
+        
+        try:
+            for chunk in self.chunks:
+                if self._stopped.is_set():
+                    break
+                put(chunk)
+            last_item = self._end_of_stream
+        except Exception as e:
+            last_item = e
+        finally:
+            self.chunks.close()
+        if not self._stopped.is_set():
+            put(last_item)
+    
+    async def iterate_chunks(self) -> AsyncIterator[str]:
+        self._producing = True
+        executors.get_executor(c.API_EXECUTOR).submit(self.produce_chunks, asyncio.get_running_loop())
+        while (item := await self._queue.get()) is not self._end_of_stream:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Unblocks the producer if the client disconnected, so it stops and closes the chunks on its own thread
+            self._stopped.set()
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            if not self._producing:
+                self.chunks.close()
+            self.semaphore.release()
+
+
+def get_query_params(request: Request) -> FrozenSet[Tuple[str, str]]:
+    return frozenset((normalize_name(key), val) for key, val in request.query_params.items() if key not in c.RESERVED_QUERY_PARAMS)
+
+
+def get_dataset_name(dataset: str) -> str:
+    # Unknown names are rejected before they can be used as metric labels
     dataset = normalize_name(dataset)
-    query_params = frozenset((normalize_name(key), val) for key, val in request.query_params.items())
-    return helper_func(dataset, query_params)
+    if dataset not in mf.parms[c.DATASETS_KEY]:
+        raise HTTPException(status_code=404, detail=f'No such dataset "{dataset}"')
+    return dataset
+
+
+async def template_function(dataset: str, request: Request, helper_func, *args, coalesce: bool = False):
+    dataset = get_dataset_name(dataset)
+    query_params = get_query_params(request)
+    with metrics.span('request', dataset=dataset):
+        if coalesce:
+            key = (dataset, query_params, *args)
+            return await results_single_flight.run(key, lambda: run_with_dataset_limit(helper_func, dataset, query_params, *args))
+        else:
+            return await run_in_executor(helper_func, dataset, query_params, *args)
+
+
+async def stream_with_dataset_limit(dataset: str, request: Request, helper_func, *args, media_type: str) -> StreamingResponse:
+    dataset = get_dataset_name(dataset)
+    semaphore = get_dataset_semaphore(dataset)
+    await semaphore.acquire()
+    try:
+        chunks = await template_function(dataset, request, helper_func, *args)
+    except BaseException:
+        semaphore.release()
+        raise
+    return DatasetLimitedStreamingResponse(chunks, semaphore, media_type)
 
 
 # Helper functions for "parameters" api
-def get_parameters_helper(dataset: str, query_params: FrozenSet[Tuple[str, str]]):
+def get_parameters_helper(dataset: str, query_params: FrozenSet[Tuple[str, str]], parameters_version: int = 0):
+    # The parameters version is only part of the arguments so that cached responses change when options are refreshed
     renderer = Renderer(dataset)
     parameters = load_selected_parameters(renderer, query_params)
     return parameters._to_dict(debug)
     
 
 # Helper functions for "get_results" api
-def get_results_helper(dataset: str, query_params: FrozenSet[Tuple[str, str]]):
-    renderer = Renderer(dataset)
+def get_results_dataframe(dataset: str, query_params: FrozenSet[Tuple[str, str]], view_cache: Optional[ResultsCache] = None) -> DataFrame:
+    renderer = Renderer(dataset, view_cache=view_cache)
     load_selected_parameters(renderer, query_params)
-    df = load_dataframe(renderer)
-    return json.loads(df.to_json(orient='table', index=False))
+    return load_dataframe(renderer)
+
+
+class ResultsPage(NamedTuple):
+    limit: Optional[int] = None
+    offset: int = 0
+    columns: Optional[Tuple[str, ...]] = None
+
+    def is_everything(self) -> bool:
+        return self == ResultsPage()
+
+
+def get_results_page(request: Request) -> ResultsPage:
+    def get_int_param(name: str, default: Optional[int]) -> Optional[int]:
+        value = request.query_params.get(name)
+        if value is None:
+            return default
+        if not value.isdigit():
+            raise HTTPException(status_code=400, detail=f'The "{name}" query parameter must be a non-negative integer')
+        return int(value)
+    
+    columns = request.query_params.get(c.COLUMNS_QUERY_PARAM)
+    columns = tuple(x.strip() for x in columns.split(',')) if columns is not None else None
+    return ResultsPage(get_int_param(c.LIMIT_QUERY_PARAM, None), get_int_param(c.OFFSET_QUERY_PARAM, 0), columns)
+
+
+def apply_results_page(df: DataFrame, page: ResultsPage) -> DataFrame:
+    if page.is_everything():
+        return df
+    
+    if page.columns is not None:
+        missing_columns = [x for x in page.columns if x not in df.columns]
+        if len(missing_columns) > 0:
+            raise HTTPException(status_code=400, detail=f'The requested columns {missing_columns} do not exist in the results')
+        df = df[list(page.columns)]
+    end = page.offset + page.limit if page.limit is not None else None
+    return df.iloc[page.offset:end]
+
+
+def encode_dataframe(df: DataFrame, format: str) -> bytes:
+    with metrics.span('serialize'):
+        if format == c.JSON_FORMAT:
+            content = df.to_json(orient='table', index=False).encode('utf-8')
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            if format == c.ARROW_FORMAT:
+                with pa.ipc.new_stream(sink, table.schema) as writer:
+                    writer.write_table(table)
+            else:
+                import pyarrow.parquet as pq
+                pq.write_table(table, sink)
+            content = sink.getvalue().to_pybytes()
+    metrics.record_response_bytes(len(content), format)
+    return content
+
+
+def get_results_bytes_helper(dataset: str, query_params: FrozenSet[Tuple[str, str]], format: str, page: ResultsPage, 
+                             cache: Optional[ResultsCache] = None, view_cache: Optional[ResultsCache] = None) -> bytes:
+    # Only the encoded response is cached. Other pages and formats rerun the final view on the cached database views
+    key = (dataset, query_params, format, page)
+    content = cache.get(key) if cache is not None else None
+    if content is None:
+        df = get_results_dataframe(dataset, query_params, view_cache)
+        content = encode_dataframe(apply_results_page(df, page), format)
+        if cache is not None:
+            cache.set(key, content)
+    return content
+
+
+def encode_dataframe_chunks(df_chunks: Iterator[DataFrame], format: str) -> Generator[str, None, None]:
+    for i, df in enumerate(df_chunks):
+        if format == c.CSV_FORMAT:
+            yield df.to_csv(index=False, header=(i == 0))
+        elif len(df) > 0:
+            yield df.to_json(orient='records', lines=True, date_format='iso').rstrip('\n') + '\n'
+
+
+def stream_results_helper(dataset: str, query_params: FrozenSet[Tuple[str, str]], format: str, page: ResultsPage, 
+                          view_cache: Optional[ResultsCache] = None) -> Generator[str, None, None]:
+    chunk_size = mf.get_setting(c.RESULTS_STREAM_CHUNK_SIZE_SETTING, 10000)
+    if page.is_everything():
+        renderer = Renderer(dataset, view_cache=view_cache)
+        load_selected_parameters(renderer, query_params)
+        renderer.set_job_context()
+        final_view_name = mf.get_dataset_parms(dataset)[c.FINAL_VIEW_KEY]
+        final_view_sql_str = renderer.get_rendered_sql_by_view().get(final_view_name)
         
+        # When the final view is a sql database view, rows are streamed from the database cursor without being cached. 
+        # If it depends on other views, it goes through the view scheduler with them instead
+        has_dependencies = len(renderer.get_view_scheduler().dependencies.get(final_view_name, [])) > 0
+        if final_view_sql_str is not None and not final_view_sql_str.endswith('.py') and not has_dependencies:
+            conn = DbConnection(mf.get_db_profile_name(dataset))
+            df_chunks = conn.get_dataframe_chunks_from_query(final_view_sql_str, chunk_size)
+            return encode_dataframe_chunks(df_chunks, format)
+    
+    df = apply_results_page(get_results_dataframe(dataset, query_params, view_cache), page)
+    df_chunks = (df.iloc[i:i+chunk_size] for i in range(0, max(len(df), 1), chunk_size))
+    return encode_dataframe_chunks(df_chunks, format)
         
-def run(no_cache: bool, debug_value: bool, uvicorn_args: List[str]):
-    global debug
+        
+def warm_up_dataset(dataset: str, warm_up_results: bool, cache: Optional[ResultsCache] = None, 
+                    view_cache: Optional[ResultsCache] = None) -> float:
+    start = time.time()
+    Renderer(dataset).warm_up()
+    if warm_up_results:
+        get_results_bytes_helper(dataset, frozenset(), c.JSON_FORMAT, ResultsPage(), cache, view_cache)
+    return time.time() - start
+
+
+def warm_up_datasets(warm_up_results: bool, cache: Optional[ResultsCache] = None, 
+                     view_cache: Optional[ResultsCache] = None) -> Dict[str, float]:
+    """
+    Loads the parameters, python files and templates of all datasets in parallel, and optionally caches the results 
+    for the default parameter selections.
+
+    Args:
+        warm_up_results (bool): Whether to also run the queries for the default parameter selections
+        cache (ResultsCache): The results cache to populate
+        view_cache (ResultsCache): The database views cache to populate
+
+    Returns:
+        A dictionary of dataset name to warm-up time in seconds, for the datasets that warmed up successfully
+    """
+    executor = executors.get_executor(c.API_EXECUTOR)
+    futures = {dataset: executor.submit(warm_up_dataset, dataset, warm_up_results, cache, view_cache) 
+               for dataset in mf.parms[c.DATASETS_KEY]}
+    
+    # A dataset that fails to warm up should not stop the server from serving the others
+    output = {}
+    for dataset, future in futures.items():
+        try:
+            output[dataset] = future.result()
+        except Exception as e:
+            print(f'Failed to warm up dataset "{dataset}": {e}')
+    return output
+
+
+def create_app(no_cache: bool, debug_value: bool, warm_up: bool = False, warm_up_results: bool = False) -> FastAPI:
+    global debug, results_single_flight
     debug = debug_value
 
     app = FastAPI()
 
+    @app.middleware('http')
+    async def record_request_duration(request: Request, call_next):
+        start = time.time()
+        with timer.new_timer() as request_timer:
+            response = await call_next(request)
+        route = getattr(request.scope.get('route'), 'path', 'unmatched')
+        labels = {'route': route, 'method': request.method, 'status': response.status_code}
+        metrics.request_duration.observe(time.time() - start, labels)
+        
+        # Timings of each activity in the request are only exposed in debug mode
+        if debug:
+            response.headers['Server-Timing'] = request_timer.get_server_timing()
+            response.headers['X-Squirrels-Timing'] = request_timer.get_summary_json()
+        return response
+
     mf.initialize(c.MANIFEST_FILE)
+    dataset_semaphores.clear()
+    results_single_flight = SingleFlight()
     squirrels_version_path = f'/squirrels{major_version}'
     config_base_path = normalize_name_for_api(mf.parms[c.BASE_PATH_KEY])
     base_path = squirrels_version_path + config_base_path
@@ -93,22 +354,75 @@ def run(no_cache: bool, debug_value: bool, uvicorn_args: List[str]):
     @app.get(base_path + parameters_path, response_class=JSONResponse)
     async def get_parameters(dataset: str, request: Request):
         helper_func = get_parameters_helper if no_cache else get_parameters_cachable
-        return template_function(dataset, request, helper_func)
+        return await template_function(dataset, request, helper_func, get_parameters_version(normalize_name(dataset)))
+    
+    admin_token = mf.get_setting(c.ADMIN_TOKEN_SETTING, None)
+
+    def check_admin_access(request: Request):
+        # Admin routes need the configured bearer token, or debug mode if there is no token
+        if admin_token is None:
+            if not debug:
+                raise HTTPException(status_code=403, detail=f'Admin routes require debug mode or the "{c.ADMIN_TOKEN_SETTING}" setting')
+        elif not secrets.compare_digest(request.headers.get('authorization', '').encode(), f'Bearer {admin_token}'.encode()):
+            raise HTTPException(status_code=401, detail='Invalid or missing admin token')
+    
+    @app.post(squirrels_version_path + '/admin/parameters/refresh', response_class=JSONResponse)
+    async def refresh_parameters_options(request: Request, dataset: Optional[str] = None):
+        check_admin_access(request)
+        dataset = get_dataset_name(dataset) if dataset is not None else None
+        threads = refresh_parameters(dataset)
+        return {'refreshing': len(threads)}
+    
+    @app.post(squirrels_version_path + '/admin/modules/reload', response_class=JSONResponse)
+    async def reload_modules(request: Request):
+        check_admin_access(request)
+        return {'reloaded': clear_module_cache()}
 
     # Results API
     results_path = '/{dataset}'
 
-    results_cache_size = mf.get_setting(c.RESULTS_CACHE_SIZE_SETTING, 128)
     results_cache_ttl = mf.get_setting(c.RESULTS_CACHE_TTL_SETTING, 60*60)
+    results_cache = create_results_cache(results_cache_ttl) if not no_cache else None
+
+    view_cache_max_bytes = mf.get_setting(c.VIEWS_CACHE_MAX_BYTES_SETTING, 256*2**20)
+    view_cache_ttl = mf.get_setting(c.VIEWS_CACHE_TTL_SETTING, 60*60)
+    view_cache = MemoryCache(view_cache_max_bytes, view_cache_ttl) if not no_cache else None
+
+    warm_up_times = None
+    if warm_up or warm_up_results:
+        warm_up_times = warm_up_datasets(warm_up_results, results_cache, view_cache)
+        for dataset, elapsed_time in warm_up_times.items():
+            print(f'Warmed up dataset "{dataset}" in {elapsed_time*1000:.1f} ms')
 
-    @ttl_cache(maxsize=results_cache_size, ttl=results_cache_ttl)
-    def get_results_cachable(*args):
-        return get_results_helper(*args)
+    streaming_media_types = {c.NDJSON_FORMAT: 'application/x-ndjson', c.CSV_FORMAT: 'text/csv'}
+    encoded_media_types = {
+        c.JSON_FORMAT: 'application/json', 
+        c.ARROW_FORMAT: 'application/vnd.apache.arrow.stream', 
+        c.PARQUET_FORMAT: 'application/vnd.apache.parquet'
+    }
+    
+    def get_results_format(request: Request) -> str:
+        format = request.query_params.get(c.FORMAT_QUERY_PARAM)
+        if format is None:
+            accepted_media_types = [x.split(';')[0].strip() for x in request.headers.get('accept', '').split(',')]
+            format = next((fmt for fmt, media_type in encoded_media_types.items() if media_type in accepted_media_types), c.JSON_FORMAT)
+        return format
     
     @app.get(base_path + results_path, response_class=JSONResponse)
     async def get_results(dataset: str, request: Request):
-        helper_func = get_results_helper if no_cache else get_results_cachable
-        return template_function(dataset, request, helper_func)
+        format = get_results_format(request)
+        page = get_results_page(request)
+        if format in streaming_media_types:
+            helper_func = partial(stream_results_helper, view_cache=view_cache)
+            return await stream_with_dataset_limit(dataset, request, helper_func, format, page, media_type=streaming_media_types[format])
+        elif format in encoded_media_types:
+            if format != c.JSON_FORMAT and importlib.util.find_spec('pyarrow') is None:
+                raise HTTPException(status_code=406, detail=f'The "{format}" format requires the pyarrow package to be installed on the server')
+            helper_func = partial(get_results_bytes_helper, cache=results_cache, view_cache=view_cache)
+            content = await template_function(dataset, request, helper_func, format, page, coalesce=True)
+            return Response(content, media_type=encoded_media_types[format])
+        else:
+            raise HTTPException(status_code=400, detail=f'Unsupported format "{format}"')
     
     # Catalog API
     @app.get(base_path, response_class=JSONResponse)
@@ -125,12 +439,33 @@ def run(no_cache: bool, debug_value: bool, uvicorn_args: List[str]):
             })
         return {'project_variables': mf.parms[c.PROJ_VARS_KEY], 'resource_paths': datasets}
     
+    # Monitoring API
+    @app.get(squirrels_version_path + '/stats', response_class=JSONResponse)
+    async def get_stats():
+        return {
+            'db_pools': db_conn.get_pool_stats(), 
+            'executors': executors.get_all_stats(),
+            'results_coalescing': results_single_flight.get_stats(),
+            'results_cache': results_cache.get_stats() if results_cache is not None else None,
+            'views_cache': view_cache.get_stats() if view_cache is not None else None,
+            'warm_up_seconds': warm_up_times
+        }
+    
+    @app.get('/metrics', response_class=PlainTextResponse)
+    async def get_metrics():
+        return PlainTextResponse(metrics.generate_latest(), media_type='text/plain; version=0.0.4')
+    
     # Squirrels UI
     @app.get('/', response_class=HTMLResponse)
     async def get_ui(request: Request):
         return templates.TemplateResponse('index.html', {'request': request, 'base_path': base_path})
 
-    
+    return app
+
+
+def run(no_cache: bool, debug_value: bool, uvicorn_args: List[str]):
+    app = create_app(no_cache, debug_value, uvicorn_args.warm_up, uvicorn_args.warm_up_results)
+
     # Run API server
     import uvicorn
     uvicorn.run(app, host=uvicorn_args.host, port=uvicorn_args.port)
@@ -2,10 +2,7 @@ import sys, time
 sys.path.append('.')
 
 import pwinput
-from squirrels import constants as c, profile_manager as pm, __version__
-from squirrels import module_loader as ml, api_server
-from squirrels.renderer import Renderer
-from squirrels.initializer import Initializer
+from squirrels import constants as c, profile_manager as pm, timer, __version__
 from argparse import ArgumentParser
 
 
@@ -59,7 +56,8 @@ def main():
     init_parser.add_argument('--final-view', type=str, choices=['sql', 'py'], help='Include final view as sql or python file')
     init_parser.add_argument('--sample-db', type=str, choices=['seattle-weather'], help='Sample sqlite database to include')
 
-    subparsers.add_parser(c.LOAD_MODULES_CMD, help='Load all the modules specified in squirrels.yaml from git')
+    load_modules_parser = subparsers.add_parser(c.LOAD_MODULES_CMD, help='Load all the modules specified in squirrels.yaml from git')
+    load_modules_parser.add_argument('--update', action='store_true', help='Clone all modules again instead of reusing cached clones (for modules on a branch)')
 
     subparsers.add_parser(c.GET_PROFILES_CMD, help='Get all database connection profile names and values')
 
@@ -79,9 +77,11 @@ def main():
     run_parser = subparsers.add_parser(c.RUN_CMD, help='Run the builtin API server')
     run_parser.add_argument('--no-cache', action='store_true', help='Do not cache any api results')
     run_parser.add_argument('--debug', action='store_true', help='In debug mode, all "hidden parameters" show in parameters response')
+    run_parser.add_argument('--warm-up', action='store_true', help='Load the parameters and templates of all datasets before serving requests')
+    run_parser.add_argument('--warm-up-results', action='store_true', help='Same as --warm-up, and also cache the results for the default parameter selections')
     run_parser.add_argument('--host', type=str, default='127.0.0.1')
     run_parser.add_argument('--port', type=int, default=8000)
-    c.timer.add_activity_time('creating argparser', start)
+    timer.add_activity_time('creating argparser', start)
 
     start = time.time()
     args, _ = parser.parse_known_args()
@@ -94,20 +94,25 @@ def main():
     elif args.command == c.DELETE_PROFILE_CMD:
         delete_profile(args)
     elif args.command == c.TEST_CMD:
+        # Modules with heavy dependencies (pandas, sqlalchemy, fastapi, git, etc.) are only imported by the commands that need them
+        from squirrels.renderer import Renderer
         Renderer(args.dataset, args.cfg, args.data).write_outputs(args.runquery)
-        c.timer.add_activity_time('all of write_outputs', start)
+        timer.add_activity_time('all of write_outputs', start)
     elif args.command == c.RUN_CMD:
+        from squirrels import api_server
         api_server.run(args.no_cache, args.debug, args)
     elif args.command == c.LOAD_MODULES_CMD:
-        ml.load_modules()
+        from squirrels import module_loader as ml
+        ml.load_modules(args.update)
     elif args.command == c.INIT_CMD:
+        from squirrels.initializer import Initializer
         Initializer(args.overwrite).init_project(args)
     elif args.command is None:
         print(f'Error: Missing command. Enter "squirrels -h" for help.')
     else:
         print(f'Error: No such command "{args.command}". Enter "squirrels -h" for help.')
     
-    c.timer.report_times(args.verbose)
+    timer.get_timer().report_times(args.verbose)
 
 
 if __name__ == '__main__':
@@ -17,6 +17,8 @@ HEADERS_KEY = 'headers'
 DATABASE_VIEWS_KEY = 'database_views'
 DB_VIEW_NAME_KEY = 'name'
 DB_VIEW_FILE_KEY = 'file'
+DB_VIEW_DEPENDS_ON_KEY = 'depends_on'
+DB_VIEW_EXECUTION_KEY = 'execution'
 FINAL_VIEW_KEY = 'final_view'
 BASE_PATH_KEY = 'base_path'
 SETTINGS_KEY = 'settings'
@@ -31,6 +33,7 @@ PASSWORD = 'password'
 MANIFEST_FILE = 'squirrels.yaml'
 OUTPUTS_FOLDER = 'outputs'
 MODULES_FOLDER = 'modules'
+MODULES_LOCK_FILE = 'modules.lock.json'
 DATASETS_FOLDER = 'datasets'
 PARAMETERS_MODULE = 'parameters'
 PARAMETERS_FILE = 'parameters.py'
@@ -38,12 +41,70 @@ PARAMETERS_OUTPUT = 'parameters.json'
 DATABASE_VIEW_NAME = 'database_view1'
 FINAL_VIEW_NAME = 'final_view'
 CONTEXT_FILE = 'context.py'
+CACHE_FOLDER = '.squirrels_cache'
 
 # Dataset setting names
 PARAMETERS_CACHE_SIZE_SETTING = 'parameters.cache.size'
 PARAMETERS_CACHE_TTL_SETTING = 'parameters.cache.ttl'
-RESULTS_CACHE_SIZE_SETTING = 'results.cache.size'
+RESULTS_CACHE_SIZE_SETTING = 'results.cache.size' # deprecated in favor of results.cache.max_bytes
 RESULTS_CACHE_TTL_SETTING = 'results.cache.ttl'
+RESULTS_CACHE_BACKEND_SETTING = 'results.cache.backend'
+RESULTS_CACHE_MAX_BYTES_SETTING = 'results.cache.max_bytes'
+RESULTS_CACHE_DIR_SETTING = 'results.cache.dir'
+RESULTS_CACHE_DISK_MAX_BYTES_SETTING = 'results.cache.disk.max_bytes'
+DB_POOL_SIZE_SETTING = 'db.pool.size'
+DB_POOL_MAX_OVERFLOW_SETTING = 'db.pool.max_overflow'
+DB_POOL_PRE_PING_SETTING = 'db.pool.pre_ping'
+DB_POOL_RECYCLE_SETTING = 'db.pool.recycle'
+DB_FETCH_MODE_SETTING = 'db.fetch.mode'
+DB_FETCH_CHUNK_SIZE_SETTING = 'db.fetch.chunk_size'
+VIEWS_CACHE_MAX_BYTES_SETTING = 'views.cache.max_bytes'
+VIEWS_CACHE_TTL_SETTING = 'views.cache.ttl'
+FINAL_VIEW_ENGINE_SETTING = 'final_view.engine'
+RESULTS_STREAM_CHUNK_SIZE_SETTING = 'results.stream.chunk_size'
+RESULTS_EXECUTOR_MAX_WORKERS_SETTING = 'results.executor.max_workers'
+VIEWS_MAX_WORKERS_SETTING = 'views.max_workers'
+PARAMETERS_MAX_WORKERS_SETTING = 'parameters.max_workers'
+PARAMETERS_REFRESH_TTL_SETTING = 'parameters.refresh.ttl'
+ADMIN_TOKEN_SETTING = 'admin.token'
+METRICS_OPENTELEMETRY_SETTING = 'metrics.opentelemetry'
+MODULES_CACHE_DIR_SETTING = 'modules.cache.dir'
+PROCESS_POOL_MAX_WORKERS_SETTING = 'process_pool.max_workers'
+FINAL_VIEW_EXECUTION_SETTING = 'final_view.execution'
+RESULTS_MAX_CONCURRENCY_SETTING = 'results.max_concurrency'
+TEMPLATES_CACHE_SIZE_SETTING = 'templates.cache.size'
+TEMPLATES_BYTECODE_CACHE_DIR_SETTING = 'templates.bytecode_cache.dir'
+
+# Reserved query parameters for the results API
+FORMAT_QUERY_PARAM = 'format'
+LIMIT_QUERY_PARAM = 'limit'
+OFFSET_QUERY_PARAM = 'offset'
+COLUMNS_QUERY_PARAM = 'columns'
+RESERVED_QUERY_PARAMS = [FORMAT_QUERY_PARAM, LIMIT_QUERY_PARAM, OFFSET_QUERY_PARAM, COLUMNS_QUERY_PARAM]
+
+# Results API formats
+JSON_FORMAT = 'json'
+NDJSON_FORMAT = 'ndjson'
+CSV_FORMAT = 'csv'
+ARROW_FORMAT = 'arrow'
+PARQUET_FORMAT = 'parquet'
+
+# Shared executor names
+API_EXECUTOR = 'api'
+VIEWS_EXECUTOR = 'views'
+PARAMETERS_EXECUTOR = 'parameters'
+
+# Fetch modes for database queries
+ROWS_FETCH_MODE = 'rows'
+ARROW_FETCH_MODE = 'arrow'
+
+# Execution modes for python views
+THREAD_EXECUTION = 'thread'
+PROCESS_EXECUTION = 'process'
+
+# Final view engines
+SQLITE_ENGINE = 'sqlite'
+DUCKDB_ENGINE = 'duckdb'
 
 # Activities to time
 IMPORT_JINJA = 'import jinja'
@@ -53,20 +114,3 @@ IMPORT_PANDAS = 'import pandas'
 # Selection cfg sections
 PARAMETERS_SECTION = 'parameters'
 HEADERS_SECTION = 'headers'
-
-# Global utilities
-import time
-
-class Timer:
-    def __init__(self):
-        self.times = {}
-    
-    def add_activity_time(self, activity, my_start):
-        self.times[activity] = self.times.get(activity, 0) + (time.time()-my_start) * 10**3
-    
-    def report_times(self, verbose):
-        if verbose:
-            for activity, time in self.times.items():
-                print(f'The time of execution of "{activity}" is:', time, "ms")
-
-timer = Timer()
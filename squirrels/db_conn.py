@@ -1,20 +1,81 @@
-import time
-from squirrels import profile_manager as pm, constants as c
+import time, threading
+from typing import Dict, Iterator, Any
+from squirrels import profile_manager as pm, manifest as mf, constants as c, metrics, timer
 
 start = time.time()
 from sqlalchemy import create_engine, text
-c.timer.add_activity_time(c.IMPORT_SQLALCHEMY, start)
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+timer.add_activity_time(c.IMPORT_SQLALCHEMY, start)
 
 start = time.time()
 import pandas as pd
-c.timer.add_activity_time(c.IMPORT_PANDAS, start)
+timer.add_activity_time(c.IMPORT_PANDAS, start)
+
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def _get_engine_kwargs(url: str) -> Dict[str, Any]:
+    kwargs = {
+        'pool_pre_ping': mf.get_setting(c.DB_POOL_PRE_PING_SETTING, True),
+        'pool_recycle': mf.get_setting(c.DB_POOL_RECYCLE_SETTING, 3600)
+    }
+    sa_url = make_url(url)
+    pool_class = sa_url.get_dialect().get_pool_class(sa_url)
+    if issubclass(pool_class, QueuePool):
+        kwargs['pool_size'] = mf.get_setting(c.DB_POOL_SIZE_SETTING, 5)
+        kwargs['max_overflow'] = mf.get_setting(c.DB_POOL_MAX_OVERFLOW_SETTING, 10)
+    return kwargs
+
+
+def get_engine(profile_name: str) -> Engine:
+    """
+    Gets the shared SQLAlchemy engine (and its connection pool) for a database profile, creating it on first use.
+
+    Args:
+        profile_name (str): The name of the database profile.
+
+    Returns:
+        The engine that is reused by all connections to the profile in this process.
+    """
+    with _engines_lock:
+        if profile_name not in _engines:
+            profile = pm.Profile(profile_name).get()
+            url = f'{profile[c.DIALECT]}://{profile[c.USERNAME]}:{profile[c.PASSWORD]}@{profile[c.CONN_URL]}'
+            _engines[profile_name] = create_engine(url, **_get_engine_kwargs(url))
+        return _engines[profile_name]
+
+
+def dispose_engines():
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    with _engines_lock:
+        engines = dict(_engines)
+    
+    output = {}
+    for profile_name, engine in engines.items():
+        pool = engine.pool
+        stats = {'pool_class': pool.__class__.__name__, 'status': pool.status()}
+        if isinstance(pool, QueuePool):
+            stats['size'] = pool.size()
+            stats['checked_in'] = pool.checkedin()
+            stats['checked_out'] = pool.checkedout()
+            stats['overflow'] = pool.overflow()
+        output[profile_name] = stats
+    return output
 
 
 class DbConnection:
     def __init__(self, profile_name: str):
         if profile_name is not None and profile_name != '':
-            profile = pm.Profile(profile_name).get()
-            self.engine = create_engine(f'{profile[c.DIALECT]}://{profile[c.USERNAME]}:{profile[c.PASSWORD]}@{profile[c.CONN_URL]}')
+            self.engine = get_engine(profile_name)
         else:
             self.engine = None
 
@@ -29,13 +90,78 @@ class DbConnection:
         Returns:
             A pandas DataFrame containing the results of the query.
         """
-        try:
-            with self.engine.connect() as conn:
-                result = conn.execute(text(query))
-                df = pd.DataFrame(result.fetchall(), columns=result.keys())
-        except AttributeError as e:
+        if self.engine is None:
             raise ValueError('A profile name must be specified for database views that use sql')
+        
+        fetch_mode = mf.get_setting(c.DB_FETCH_MODE_SETTING, c.ROWS_FETCH_MODE)
+        if fetch_mode == c.ROWS_FETCH_MODE:
+            with self.engine.connect() as conn:
+                with metrics.span('query'):
+                    result = conn.execute(text(query))
+                with metrics.span('fetch'):
+                    df = pd.DataFrame(result.fetchall(), columns=result.keys())
+        elif fetch_mode == c.ARROW_FETCH_MODE:
+            table = self._get_arrow_table_from_query(query)
+            with metrics.span('fetch'):
+                df = table.to_pandas()
+        else:
+            raise ValueError(f'The setting "{c.DB_FETCH_MODE_SETTING}" must be "{c.ROWS_FETCH_MODE}" or "{c.ARROW_FETCH_MODE}", not "{fetch_mode}"')
 
         return df
 
-        
\ No newline at end of file
+    def _get_arrow_table_from_query(self, query: str):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError(f'The "{c.ARROW_FETCH_MODE}" fetch mode requires the pyarrow package. To install, use: "pip install pyarrow"')
+        
+        chunk_size = mf.get_setting(c.DB_FETCH_CHUNK_SIZE_SETTING, 100000)
+        with self.engine.connect() as conn:
+            with metrics.span('query'):
+                result = conn.execution_options(stream_results=True).execute(text(query))
+            
+            # Use the bulk columnar fetch of the driver if it has one (such as duckdb and ADBC drivers)
+            cursor = getattr(result, 'cursor', None)
+            if hasattr(cursor, 'fetch_arrow_table'):
+                with metrics.span('fetch'):
+                    return cursor.fetch_arrow_table()
+            
+            # Otherwise, only one chunk of rows exists as python objects at a time before it's packed into arrow arrays.
+            # Plain tuples from the DBAPI cursor are used, since textual queries have no result types to process
+            columns = list(result.keys())
+            fetchmany = cursor.fetchmany if cursor is not None else result.fetchmany
+            tables = []
+            with metrics.span('fetch'):
+                rows = fetchmany(chunk_size)
+                while len(rows) > 0:
+                    arrays = [pa.array(values) for values in zip(*rows)]
+                    tables.append(pa.Table.from_arrays(arrays, names=columns))
+                    rows = fetchmany(chunk_size)
+        
+        if len(tables) == 0:
+            return pa.table({x: pa.array([]) for x in columns})
+        return pa.concat_tables(tables, promote_options='permissive')
+
+    def get_dataframe_chunks_from_query(self, query: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Executes a SQL query and lazily fetches the results from the database cursor in batches.
+
+        Args:
+            query (str): The SQL query to execute.
+            chunk_size (int): The maximum number of rows per batch.
+
+        Returns:
+            An iterator of pandas DataFrames. At least one (possibly empty) DataFrame is produced.
+        """
+        if self.engine is None:
+            raise ValueError('A profile name must be specified for database views that use sql')
+        
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(text(query))
+            columns = list(result.keys())
+            rows = result.fetchmany(chunk_size)
+            yield pd.DataFrame(rows, columns=columns)
+            while len(rows) == chunk_size:
+                rows = result.fetchmany(chunk_size)
+                if len(rows) > 0:
+                    yield pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,118 @@
+import os, time, threading, contextvars, multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from typing import Dict, Callable, Optional, Any
+from squirrels import constants as c, manifest as mf
+
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    def __init__(self, name: str, max_workers: int):
+        """
+        Constructor for InstrumentedExecutor, a thread pool that tracks queue depth and how long tasks wait for a worker.
+
+        Args:
+            name (str): The name of the pool, used as the prefix of thread names
+            max_workers (int): The maximum number of threads
+        """
+        super().__init__(max_workers=max_workers, thread_name_prefix=f'squirrels-{name}')
+        self.name = name
+        self.max_workers = max_workers
+        self._stats_lock = threading.Lock()
+        self.num_queued = 0
+        self.num_running = 0
+        self.num_completed = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def submit(self, fn: Callable[..., Any], /, *args, **kwargs) -> Future:
+        # Tasks run in a copy of the submitter's context, so context variables (such as metric labels) carry over
+        context = contextvars.copy_context()
+        submit_time = time.time()
+        with self._stats_lock:
+            self.num_queued += 1
+        
+        def run_task():
+            wait_time = time.time() - submit_time
+            with self._stats_lock:
+                self.num_queued -= 1
+                self.num_running += 1
+                self.total_wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self.num_running -= 1
+                    self.num_completed += 1
+        
+        return super().submit(run_task)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            num_started = self.num_running + self.num_completed
+            return {
+                'max_workers': self.max_workers,
+                'queued': self.num_queued,
+                'running': self.num_running,
+                'completed': self.num_completed,
+                'avg_wait_ms': self.total_wait_time / num_started * 10**3 if num_started > 0 else 0,
+                'max_wait_ms': self.max_wait_time * 10**3
+            }
+
+
+_executors: Dict[str, InstrumentedExecutor] = {}
+_executors_lock = threading.Lock()
+
+_max_workers_settings = {
+    c.API_EXECUTOR: (c.RESULTS_EXECUTOR_MAX_WORKERS_SETTING, 16),
+    c.VIEWS_EXECUTOR: (c.VIEWS_MAX_WORKERS_SETTING, 8),
+    c.PARAMETERS_EXECUTOR: (c.PARAMETERS_MAX_WORKERS_SETTING, 4)
+}
+
+
+def get_executor(name: str) -> InstrumentedExecutor:
+    """
+    Gets the process-wide executor with the given name, creating it on first use with the max workers from the settings.
+
+    Args:
+        name (str): One of the executor names in the constants module
+
+    Returns:
+        The shared InstrumentedExecutor
+    """
+    with _executors_lock:
+        if name not in _executors:
+            setting_name, default_max_workers = _max_workers_settings[name]
+            _executors[name] = InstrumentedExecutor(name, mf.get_setting(setting_name, default_max_workers))
+        return _executors[name]
+
+
+def get_all_stats() -> Dict[str, Dict[str, Any]]:
+    with _executors_lock:
+        executors = dict(_executors)
+    return {name: executor.get_stats() for name, executor in executors.items()}
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _initialize_process(manifest_path: str):
+    mf.initialize(manifest_path)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Gets the process-wide pool of worker processes for running CPU-heavy python views, creating it on first use.
+
+    Workers are spawned (rather than forked from a multi-threaded process) with the same working directory and sys.path,
+    and stay alive between tasks so that their caches stay warm.
+
+    Returns:
+        The shared ProcessPoolExecutor
+    """
+    global _process_pool
+    with _executors_lock:
+        if _process_pool is None:
+            max_workers = mf.get_setting(c.PROCESS_POOL_MAX_WORKERS_SETTING, os.cpu_count())
+            _process_pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'), 
+                                                initializer=_initialize_process, initargs=(c.MANIFEST_FILE,))
+        return _process_pool
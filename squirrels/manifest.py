@@ -1,10 +1,10 @@
 import time, yaml
 from typing import Dict, Any
-from squirrels import constants as c
+from squirrels import constants as c, timer
 
 start = time.time()
 import jinja2 as j2
-c.timer.add_activity_time(c.IMPORT_JINJA, start)
+timer.add_activity_time(c.IMPORT_JINJA, start)
 
 parms = None
 
@@ -34,5 +34,12 @@ def get_db_profile_name(dataset: str) -> str:
 
 
 def get_setting(key: str, default: Any):
+    if parms is None:
+        return default
     settings: Dict[str, str] = parms.get(c.SETTINGS_KEY, {})
-    return settings.get(key, default)
\ No newline at end of file
+    return settings.get(key, default)
+
+
+def get_dataset_setting(dataset: str, key: str, default: Any):
+    dataset_settings: Dict[str, str] = get_dataset_parms(dataset).get(c.SETTINGS_KEY, {})
+    return dataset_settings.get(key, get_setting(key, default))
\ No newline at end of file
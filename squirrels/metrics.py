@@ -0,0 +1,141 @@
+import time, math, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Tuple, Iterator
+from squirrels import constants as c, manifest as mf, timer
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, label_names: List[str], buckets: List[float]):
+        """
+        Constructor for Histogram, a thread-safe metric in the format of a Prometheus histogram.
+
+        Args:
+            name (str): The name of the metric
+            description (str): The help text of the metric
+            label_names (List[str]): The names of the labels that every observation has
+            buckets (List[float]): The upper bounds of the buckets, in increasing order
+        """
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets + [math.inf]
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Dict[str, str]):
+        label_values = tuple(str(labels.get(x, '')) for x in self.label_names)
+        with self._lock:
+            if label_values not in self._values:
+                self._values[label_values] = ([0] * len(self.buckets), [0.0])
+            bucket_counts, total = self._values[label_values]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1
+            total[0] += value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def collect(self) -> Iterator[str]:
+        def format_labels(label_values: Tuple[str, ...], extra: Dict[str, str] = {}) -> str:
+            pairs = list(zip(self.label_names, label_values)) + list(extra.items())
+            escaped = (name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for name, value in pairs)
+            return '{' + ','.join(escaped) + '}'
+
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            values = [(k, list(v[0]), v[1][0]) for k, v in self._values.items()]
+        for label_values, bucket_counts, total in values:
+            for bound, count in zip(self.buckets, bucket_counts):
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                yield f'{self.name}_bucket{format_labels(label_values, {"le": le})} {count}'
+            yield f'{self.name}_sum{format_labels(label_values)} {total}'
+            yield f'{self.name}_count{format_labels(label_values)} {bucket_counts[-1]}'
+
+
+_duration_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+_size_buckets = [10**i for i in range(0, 10)]
+
+request_duration = Histogram('squirrels_request_duration_seconds', 'Time to handle an API request (until the response starts)',
+                             ['route', 'method', 'status'], _duration_buckets)
+stage_duration = Histogram('squirrels_stage_duration_seconds', 'Time spent in each stage of producing the results of a dataset',
+                           ['dataset', 'view', 'stage'], _duration_buckets)
+view_rows = Histogram('squirrels_view_rows', 'Number of rows produced by database views and final views',
+                      ['dataset', 'view'], _size_buckets)
+response_bytes = Histogram('squirrels_response_bytes', 'Size of encoded results', ['dataset', 'format'], _size_buckets)
+
+_histograms = [request_duration, stage_duration, view_rows, response_bytes]
+_labels: ContextVar[Dict[str, str]] = ContextVar('squirrels_metric_labels', default={})
+
+
+@lru_cache(maxsize=None)
+def _get_tracer():
+    if not mf.get_setting(c.METRICS_OPENTELEMETRY_SETTING, False):
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        raise RuntimeError(f'The setting "{c.METRICS_OPENTELEMETRY_SETTING}" requires the opentelemetry-api package. To install, use: "pip install opentelemetry-api"')
+    return trace.get_tracer('squirrels')
+
+
+def get_labels() -> Dict[str, str]:
+    return _labels.get()
+
+
+@contextmanager
+def span(stage: str, **labels: str):
+    """
+    Times a stage of producing results and records it in the stage duration histogram (and as an OpenTelemetry span if
+    enabled). The labels are also applied to the spans and row counts recorded inside this one, including in threads
+    of the squirrels executors.
+
+    Args:
+        stage (str): The name of the stage, such as "render", "query", "fetch", "final_view" or "serialize"
+        **labels (str): The labels to add to the current ones, such as "dataset" and "view"
+    """
+    all_labels = {**_labels.get(), **labels}
+    token = _labels.set(all_labels)
+    tracer = _get_tracer()
+    start = time.time()
+    try:
+        with timer.span(stage):
+            if tracer is not None:
+                attributes = {f'squirrels.{k}': v for k, v in all_labels.items()}
+                with tracer.start_as_current_span(f'squirrels.{stage}', attributes=attributes):
+                    yield
+            else:
+                yield
+    finally:
+        stage_duration.observe(time.time() - start, {**all_labels, 'stage': stage})
+        _labels.reset(token)
+
+
+def record_rows(num_rows: int, **labels: str):
+    view_rows.observe(num_rows, {**_labels.get(), **labels})
+
+
+def record_response_bytes(num_bytes: int, format: str):
+    response_bytes.observe(num_bytes, {**_labels.get(), 'format': format})
+
+
+def generate_latest() -> str:
+    """
+    Gets all metrics in the Prometheus text exposition format.
+
+    Returns:
+        The text for a "/metrics" response
+    """
+    lines = []
+    for histogram in _histograms:
+        lines.extend(histogram.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    for histogram in _histograms:
+        histogram.clear()
@@ -1,6 +1,7 @@
-from typing import List
+from typing import Dict, List, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor
 from squirrels import constants as c, manifest as mf
-import git, shutil, os, stat
+import git, shutil, os, stat, json, hashlib
 
 
 def parse_module_repo_strings(repo_strings):
@@ -21,20 +22,109 @@ def parse_module_repo_strings(repo_strings):
     return output
 
 
+def _remove_tree(path: str):
+    def del_rw(action, name, exc):
+        os.chmod(name, stat.S_IWRITE)
+        os.remove(name)
+    shutil.rmtree(path, onerror=del_rw)
 
-def load_modules():
-    mf.initialize(c.MANIFEST_FILE)
-    
-    repo_strings: List[str] = mf.parms[c.MODULES_KEY]
 
-    # Recreate the modules directory if it exists
-    if os.path.exists(c.MODULES_FOLDER):
-        def del_rw(action, name, exc):
-            os.chmod(name, stat.S_IWRITE)
-            os.remove(name)
-        shutil.rmtree(c.MODULES_FOLDER, onerror=del_rw)
-    os.mkdir(c.MODULES_FOLDER)
-    
+def _get_cache_key(url: str, tag: str) -> str:
+    return hashlib.sha256(f'{url}@{tag}'.encode('utf-8')).hexdigest()[:32]
+
+
+def _clone_to_cache(cache_dir: str, url: str, tag: str, update: bool) -> str:
+    cache_path = os.path.join(cache_dir, _get_cache_key(url, tag))
+    if os.path.exists(cache_path) and not update:
+        return cache_path
+
+    # Clone into a temporary folder first, so an interrupted clone never looks like a complete one
+    temp_path = f'{cache_path}.{os.getpid()}.tmp'
+    if os.path.exists(temp_path):
+        _remove_tree(temp_path)
+    try:
+        git.Repo.clone_from(url, temp_path, branch=tag, depth=1)
+    except Exception:
+        if os.path.exists(temp_path):
+            _remove_tree(temp_path)
+        raise
+    if os.path.exists(cache_path):
+        _remove_tree(cache_path)
+    os.replace(temp_path, cache_path)
+    return cache_path
+
+
+def _copy_from_cache(cache_path: str, module_path: str):
+    # Files are copied rather than hard linked, so editing a module (or running git in it) never changes the cache
+    if os.path.exists(module_path):
+        _remove_tree(module_path)
+    shutil.copytree(cache_path, module_path)
+
+
+def _read_lock_file() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(c.MODULES_LOCK_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_module_repos(repo_strings: List[str], update: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads git repos into the modules folder. Each (url, tag) is cloned at most once into a local cache (concurrently
+    with the others), and modules that are unchanged since the last run (according to the lock file) are left as is.
+
+    Args:
+        repo_strings (List[str]): The modules in the format "git_url@tag" or "folder_name=git_url@tag"
+        update (bool): Whether to clone every module again, for tags that are branches
+
+    Returns:
+        The contents of the lock file, which has the url, tag and commit of each module
+    """
     module_repos = parse_module_repo_strings(repo_strings)
+    cache_dir = mf.get_setting(c.MODULES_CACHE_DIR_SETTING, os.path.join(c.CACHE_FOLDER, 'modules'))
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(c.MODULES_FOLDER, exist_ok=True)
+
+    # Remove the modules that are no longer listed
+    module_names = set(name for name, _, _ in module_repos)
+    for entry in os.scandir(c.MODULES_FOLDER):
+        if entry.name in module_names:
+            continue
+        if entry.is_dir():
+            _remove_tree(entry.path)
+        else:
+            os.remove(entry.path)
+
+    old_lock = _read_lock_file()
+    def is_locked(name: str, url: str, tag: str) -> bool:
+        entry = old_lock.get(name, {})
+        return entry.get('url') == url and entry.get('tag') == tag and os.path.isdir(os.path.join(c.MODULES_FOLDER, name))
+
+    repos_to_load = [x for x in module_repos if update or not is_locked(*x)]
+    url_tags: List[Tuple[str, str]] = list(dict.fromkeys((url, tag) for _, url, tag in repos_to_load))
+    if len(url_tags) > 0:
+        with ThreadPoolExecutor(max_workers=min(len(url_tags), 8)) as executor:
+            cache_paths = list(executor.map(lambda x: _clone_to_cache(cache_dir, *x, update), url_tags))
+        cache_path_by_url_tag = dict(zip(url_tags, cache_paths))
+
+    new_lock = {}
     for name, url, tag in module_repos:
-        git.Repo.clone_from(url, f"modules/{name}", branch=tag, depth=1)
+        if (name, url, tag) in repos_to_load:
+            cache_path = cache_path_by_url_tag[(url, tag)]
+            _copy_from_cache(cache_path, os.path.join(c.MODULES_FOLDER, name))
+            commit = git.Repo(cache_path).head.commit.hexsha
+            new_lock[name] = {'url': url, 'tag': tag, 'commit': commit}
+        else:
+            new_lock[name] = old_lock[name]
+
+    with open(c.MODULES_LOCK_FILE, 'w') as f:
+        json.dump(new_lock, f, indent=4)
+    return new_lock
+
+
+def load_modules(update: bool = False):
+    mf.initialize(c.MANIFEST_FILE)
+
+    repo_strings: List[str] = mf.parms[c.MODULES_KEY]
+    load_module_repos(repo_strings, update)
@@ -1,18 +1,20 @@
 from __future__ import annotations
-import time, concurrent.futures
+import time, copy
 from dataclasses import dataclass
 from collections import OrderedDict
+from itertools import chain
 from typing import List, Dict, Optional, Union, Type
 from datetime import datetime
 from enum import Enum
 from decimal import Decimal
-from squirrels import constants as c
+from squirrels import constants as c, timer
 from squirrels.db_conn import DbConnection
+from squirrels.executors import get_executor
 
 
 start = time.time()
 import pandas as pd
-c.timer.add_activity_time(c.IMPORT_PANDAS, start)
+timer.add_activity_time(c.IMPORT_PANDAS, start)
 
 
 class WidgetType(Enum):
@@ -70,25 +72,24 @@ class OptionsDataSource(DataSource):
         parent_id_col = 'parent_id' if from_sample else self.parent_id_col
         cond_default_col = 'is_cond_default' if from_sample else self.is_cond_default_col
         
-        def get_parent_id(row):
-            if parent_id_col is not None and not pd.isnull(row[parent_id_col]):
-                return str(row[parent_id_col])
-            else:
-                return None
+        df = df.sort_values(order_by_col)
         
-        def is_cond_default(row):
-            if cond_default_col is not None and not pd.isnull(row[cond_default_col]):
-                return int(row[cond_default_col]) == 1
-            else:
-                return False
+        def get_column_values(col: Optional[str], converter, null_value):
+            if col is None:
+                return [null_value] * len(df)
+            values = df[col].to_numpy(dtype=object)
+            return [null_value if is_null else converter(value) for value, is_null in zip(values, pd.isnull(values))]
         
-        df.sort_values(order_by_col, inplace=True)
-        options = [ParameterOption(str(row[id_col]), str(row[options_col]), get_parent_id(row), is_cond_default(row)) for _, row in df.iterrows()]
+        ids = [str(x) for x in df[id_col].to_numpy(dtype=object)]
+        labels = [str(x) for x in df[options_col].to_numpy(dtype=object)]
+        parent_ids = get_column_values(parent_id_col, str, None)
+        cond_defaults = get_column_values(cond_default_col, lambda x: int(x) == 1, False)
+        options = list(map(ParameterOption, ids, labels, parent_ids, cond_defaults))
         
         default_ids = []
         if default_col is not None:
-            df_filtered = df.query(f'{default_col} == 1')
-            default_ids = [str(x) for x in df_filtered[id_col].values.tolist()]
+            is_default = (df[default_col] == 1).to_numpy()
+            default_ids = [x for x, flag in zip(ids, is_default) if flag]
         
         if ds_param.widget_type == WidgetType.SingleSelect:
             default_id = default_ids[0] if len(default_ids) > 0 else None
@@ -187,6 +188,14 @@ class _SelectionParameter(Parameter):
     def __post_init__(self):
         self.all_options = list(self.options)
         self.selected_parent_ids = set()
+        self._positions_by_parent_id: Dict[Optional[str], List[int]] = {}
+        for position, option in enumerate(self.all_options):
+            self._positions_by_parent_id.setdefault(option.parent_id, []).append(position)
+        self._set_options(self.options)
+
+    def _set_options(self, options: List[ParameterOption]):
+        self.options = options
+        self._option_index: Dict[str, int] = {x.identifier: i for i, x in enumerate(options)}
 
     def get_selected_ids_as_list(self):
         return []
@@ -197,13 +206,15 @@ class _SelectionParameter(Parameter):
             parent_param: _SelectionParameter = parameters[self.parent]
             parent_param.trigger_refresh = True
             self.selected_parent_ids = set(parent_param.get_selected_ids_as_list())
-            self.options = [x for x in self.all_options if x.parent_id in self.selected_parent_ids]
+            positions_by_parent = [self._positions_by_parent_id.get(x, []) for x in self.selected_parent_ids]
+            positions = positions_by_parent[0] if len(positions_by_parent) == 1 else sorted(chain.from_iterable(positions_by_parent))
+            self._set_options([self.all_options[i] for i in positions])
 
     def get_cond_default_iterator(self):
         return (x.identifier for x in self.options if x.is_cond_default)
     
     def is_selected_id_in_options(self, selected_id):
-        return selected_id in [x.identifier for x in self.options]
+        return selected_id in self._option_index
     
     def verify_selected_id_in_options(self, selected_id):
         if not self.is_selected_id_in_options(selected_id):
@@ -235,7 +246,7 @@ class SingleSelectParameter(_SelectionParameter):
         self.selected_id = selection if self.is_selected_id_in_options(selection) else self.default_id
 
     def get_selected(self) -> ParameterOption:
-        return next(x for x in self.options if x.identifier == self.selected_id)
+        return self.options[self._option_index[self.selected_id]]
     
     def get_selected_id(self) -> str:
         return self.get_selected().identifier
@@ -288,7 +299,8 @@ class MultiSelectParameter(_SelectionParameter):
         if len(self.selected_ids) == 0 and self.include_all:
             result = self.options
         else:
-            result = [x for x in self.options if x.identifier in self.selected_ids]
+            positions = sorted({self._option_index[x] for x in self.selected_ids if x in self._option_index})
+            result = [self.options[i] for i in positions]
         return result
     
     def get_selected_ids_as_list(self) -> List[str]:
@@ -451,13 +463,16 @@ class DataSourceParameter(Parameter):
     data_source: OptionsDataSource
     trigger_refresh: bool
     parent: Optional[str]
+    refresh_ttl: Optional[float]
 
     def __init__(self, widget_type: str, label: str, data_source: OptionsDataSource, *, 
-                 is_hidden: bool = False, trigger_refresh: bool = False, parent: Optional[str] = None):
+                 is_hidden: bool = False, trigger_refresh: bool = False, parent: Optional[str] = None, 
+                 refresh_ttl: Optional[float] = None):
         super().__init__(widget_type, label, is_hidden)
         self.data_source = data_source
         self.trigger_refresh = trigger_refresh
         self.parent = parent
+        self.refresh_ttl = refresh_ttl
 
     def _convert(self, profile_name: str, df: pd.DataFrame = None) -> Parameter:
         from_sample = (df is not None)
@@ -477,6 +492,7 @@ class ParameterSet:
     def __init__(self, parameters: Dict[str, Parameter]):
         self._parameters_dict: OrderedDict[str, Parameter] = OrderedDict()
         self._data_source_params: OrderedDict[str, DataSourceParameter] = OrderedDict()
+        self._converted_times: Dict[str, float] = {}
         for key, param in parameters.items():
             self._parameters_dict[key] = param
             if isinstance(param, DataSourceParameter):
@@ -492,20 +508,72 @@ class ParameterSet:
     def __getitem__(self, param_name: str) -> Parameter:
         return self.get_parameter_by_name(param_name)
 
-    def _convert_datasource_params(self, profile_name: str, test_file: str = None):
+    def copy(self) -> ParameterSet:
+        """
+        Creates a copy for applying selections without affecting this parameter set.
+
+        Only the parameter objects are copied (shallowly). Options, defaults and data sources are shared with this
+        parameter set, so the cost is proportional to the number of parameters rather than the number of options.
+        Selections and refreshes must therefore reassign attributes instead of mutating shared lists in place.
+
+        Returns:
+            A new ParameterSet
+        """
+        new_set = ParameterSet.__new__(ParameterSet)
+        new_set._parameters_dict = OrderedDict((key, copy.copy(param)) for key, param in self._parameters_dict.items())
+        new_set._data_source_params = self._data_source_params
+        new_set._converted_times = dict(self._converted_times)
+        return new_set
+
+    def _convert_datasource_params(self, profile_name: str, test_file: str = None, names: Optional[List[str]] = None):
+        """
+        Replaces data source parameters with the parameters created from their lookup data. The original data source
+        parameters are kept so they can be converted again when their options need refreshing.
+
+        Args:
+            profile_name (str): The database connection profile for the lookup queries
+            test_file (str): Path to a csv file of sample lookup data to use instead of querying the database
+            names (List[str]): The names of the data source parameters to convert. Defaults to all of them
+        """
         df_all = pd.read_csv(test_file) if test_file is not None else None
+        names = list(self._data_source_params) if names is None else names
         
-        def convert(item):
-            key, ds_param = item
+        def convert(key: str):
             df = df_all.query(f'parameter == "{key}"') if df_all is not None else None
-            return key, ds_param._convert(profile_name, df)
-
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            converted_params = list(executor.map(convert, self._data_source_params.items()))
-            for key, parameter in converted_params:
-                self._parameters_dict[key] = parameter
-                parameter.refresh(self)
-        self._data_source_params.clear()
+            return key, self._data_source_params[key]._convert(profile_name, df)
+
+        converted_params = list(get_executor(c.PARAMETERS_EXECUTOR).map(convert, names))
+        converted_time = time.time()
+        for key, parameter in converted_params:
+            self._parameters_dict[key] = parameter
+            self._converted_times[key] = converted_time
+        
+        # Parameters are refreshed in order, so children see the new options of their parents
+        for parameter in self._parameters_dict.values():
+            parameter.refresh(self)
+    
+    def _get_expired_datasource_params(self, default_ttl: Optional[float] = None) -> List[str]:
+        now = time.time()
+        expired = []
+        for key, ds_param in self._data_source_params.items():
+            ttl = ds_param.refresh_ttl if ds_param.refresh_ttl is not None else default_ttl
+            if ttl is not None and now - self._converted_times.get(key, 0) >= ttl:
+                expired.append(key)
+        return expired
+    
+    def _with_refreshed_datasource_params(self, profile_name: str, test_file: str = None, 
+                                          names: Optional[List[str]] = None) -> ParameterSet:
+        new_set = self.copy()
+        new_set._convert_datasource_params(profile_name, test_file, names)
+        return new_set
+    
+    def _with_postponed_refresh(self, names: List[str]) -> ParameterSet:
+        # Keeps the current options of the given parameters for another time-to-live, such as after a failed refresh
+        new_set = self.copy()
+        now = time.time()
+        for key in names:
+            new_set._converted_times[key] = now
+        return new_set
     
     def _to_dict(self, debug: bool = False):
         output = {'parameters': [x._to_dict(key) for key, x in self._parameters_dict.items() if not x.is_hidden or debug]}
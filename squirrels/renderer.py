@@ -1,21 +1,24 @@
-import os, json, time, copy
-import concurrent.futures
-from typing import Dict, Tuple, List, Union, Any
-from importlib.machinery import SourceFileLoader
+import os, re, sys, json, time, pickle, hashlib, threading
+import importlib.util
+from types import ModuleType
+from typing import Dict, Tuple, List, Set, Union, Optional, Any
 from configparser import ConfigParser
 from pathlib import Path
 from functools import lru_cache
-from squirrels import constants as c, manifest as mf
+from squirrels import constants as c, manifest as mf, metrics, timer
 from squirrels.db_conn import DbConnection
+from squirrels.results_cache import ResultsCache
+from squirrels.view_scheduler import ViewScheduler
+from squirrels.executors import get_executor, get_process_pool
 
 start = time.time()
 import jinja2 as j2
-c.timer.add_activity_time(c.IMPORT_JINJA, start)
+timer.add_activity_time(c.IMPORT_JINJA, start)
 
 start = time.time()
 from pandasql import sqldf
 from pandas import DataFrame
-c.timer.add_activity_time(c.IMPORT_PANDAS, start)
+timer.add_activity_time(c.IMPORT_PANDAS, start)
 
 from squirrels.parameter_configs import ParameterSet
 
@@ -31,13 +34,127 @@ def get_file_path(relative_folder: str, filename: str):
     return str(filepath) if filepath is not None else None
 
 
+_module_cache: Dict[str, Tuple[Tuple[int, int], ModuleType]] = {}
+_module_cache_lock = threading.Lock()
+
+
+def load_module(module_path: str) -> ModuleType:
+    """
+    Imports a python file by path, reusing the previously imported module if the file has not changed since.
+
+    The module is registered in sys.modules under a name derived from its path (instead of a name like "context" that could
+    clash with other files or packages), and it is re-executed only when the modified time or size of the file changes.
+
+    Args:
+        module_path (str): The path to the python file.
+
+    Returns:
+        The imported module.
+    """
+    abs_path = os.path.abspath(module_path)
+    file_stat = os.stat(abs_path)
+    file_version = (file_stat.st_mtime_ns, file_stat.st_size)
+    with _module_cache_lock:
+        cached = _module_cache.get(abs_path)
+    if cached is not None and cached[0] == file_version:
+        return cached[1]
+    
+    # Features like dataclasses look up the module of a class in sys.modules while the module is executing
+    module_name = 'squirrels_dataset_' + hashlib.sha256(abs_path.encode('utf-8')).hexdigest()[:32]
+    spec = importlib.util.spec_from_file_location(module_name, abs_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    with _module_cache_lock:
+        _module_cache[abs_path] = (file_version, module)
+    return module
+
+
+def clear_module_cache() -> int:
+    """
+    Forgets all imported python files, so they are executed again the next time they are used (even if unchanged).
+
+    Returns:
+        The number of modules that were cleared
+    """
+    with _module_cache_lock:
+        num_modules = len(_module_cache)
+        _module_cache.clear()
+    return num_modules
+
+
 def run_module_main(input_folder: str, py_file: str, main_args: Dict[str, Any] = {}) -> Any:
     module_path = get_file_path(input_folder, py_file)
-    module = SourceFileLoader(py_file, module_path).load_module()
+    module = load_module(module_path)
     return module.main(**main_args)
 
 
+def serialize_dataframe(df: DataFrame) -> bytes:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize_dataframe(content: bytes) -> DataFrame:
+    if content.startswith(pickle.PROTO):
+        return pickle.loads(content)
+    
+    import pyarrow as pa
+    return pa.ipc.open_stream(content).read_pandas()
+
+
+_worker_parameters_versions: Dict[str, int] = {}
+
+
+def _run_python_view_in_process(dataset: str, lu_data: Optional[str], selections: Dict[str, str], parameters_version: int, 
+                                py_file: str, serialized_views: Optional[Dict[str, bytes]]) -> bytes:
+    # Runs in a worker of the process pool, where the parameters, modules and templates stay cached between calls. The
+    # parameters are rebuilt when the server process has refreshed them since, so new options are seen here as well
+    if _worker_parameters_versions.get(dataset, 0) != parameters_version:
+        with _parameters_lock:
+            for key in [x for x in _parameters_cache if x[1] == dataset]:
+                del _parameters_cache[key]
+        _worker_parameters_versions[dataset] = parameters_version
+    
+    renderer = Renderer(dataset, lu_data=lu_data)
+    renderer.apply_selections(selections)
+    renderer.set_job_context()
+    database_views = {k: deserialize_dataframe(v) for k, v in serialized_views.items()} if serialized_views is not None else None
+    df = renderer.run_python_view(py_file, database_views)
+    return serialize_dataframe(df)
+
+
 @lru_cache(maxsize=None)
+def get_template_env() -> j2.Environment:
+    bytecode_cache = None
+    bytecode_cache_dir = mf.get_setting(c.TEMPLATES_BYTECODE_CACHE_DIR_SETTING, None)
+    if bytecode_cache_dir is not None:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+        bytecode_cache = j2.FileSystemBytecodeCache(bytecode_cache_dir)
+    
+    # With auto_reload, a cached template is recompiled only when the mtime of its file changes
+    cache_size = mf.get_setting(c.TEMPLATES_CACHE_SIZE_SETTING, 400)
+    return j2.Environment(loader=j2.FileSystemLoader('.'), auto_reload=True, cache_size=cache_size, bytecode_cache=bytecode_cache)
+
+
+ParametersKey = Tuple[str, str, Optional[str]]
+_parameters_cache: Dict[ParametersKey, ParameterSet] = {}
+_parameters_versions: Dict[str, int] = {}
+_parameters_refreshing: Set[ParametersKey] = set()
+_parameters_lock = threading.Lock()
+
+
 def load_parameters_helper(input_folder: str, dataset: str, lu_data: str) -> ParameterSet:
     lu_data_path = get_file_path(input_folder, lu_data)
     db_profile_name = mf.get_db_profile_name(dataset) if lu_data is None else None
@@ -45,21 +162,101 @@ def load_parameters_helper(input_folder: str, dataset: str, lu_data: str) -> Par
     parameters._convert_datasource_params(db_profile_name, lu_data_path)
     return parameters
 
+
+def _refresh_parameters_helper(key: ParametersKey, parameters: ParameterSet, names: List[str]):
+    input_folder, dataset, lu_data = key
+    try:
+        lu_data_path = get_file_path(input_folder, lu_data)
+        db_profile_name = mf.get_db_profile_name(dataset) if lu_data is None else None
+        new_parameters = parameters._with_refreshed_datasource_params(db_profile_name, lu_data_path, names)
+        with _parameters_lock:
+            _parameters_cache[key] = new_parameters
+            _parameters_versions[dataset] = _parameters_versions.get(dataset, 0) + 1
+    except Exception as e:
+        print(f'Failed to refresh the data source parameters {names} for dataset "{dataset}": {e}')
+        # Retry after another time-to-live instead of on every request
+        with _parameters_lock:
+            if _parameters_cache.get(key) is parameters:
+                _parameters_cache[key] = parameters._with_postponed_refresh(names)
+    finally:
+        with _parameters_lock:
+            _parameters_refreshing.discard(key)
+
+
+def _start_parameters_refresh(key: ParametersKey, parameters: ParameterSet, names: List[str]) -> Optional[threading.Thread]:
+    with _parameters_lock:
+        if key in _parameters_refreshing:
+            return None
+        _parameters_refreshing.add(key)
+    
+    # A dedicated thread is used since the refresh itself waits on the parameters executor
+    thread = threading.Thread(target=_refresh_parameters_helper, args=(key, parameters, names), daemon=True)
+    thread.start()
+    return thread
+
+
 def load_parameters(input_folder: str, dataset: str, lu_data: str) -> ParameterSet:
-    return copy.deepcopy(load_parameters_helper(input_folder, dataset, lu_data))
+    key = (input_folder, dataset, lu_data)
+    with _parameters_lock:
+        parameters = _parameters_cache.get(key)
+    
+    if parameters is None:
+        parameters = load_parameters_helper(input_folder, dataset, lu_data)
+        with _parameters_lock:
+            parameters = _parameters_cache.setdefault(key, parameters)
+    else:
+        # Expired options are rebuilt in the background, and served as is until the new parameters are swapped in
+        default_ttl = mf.get_dataset_setting(dataset, c.PARAMETERS_REFRESH_TTL_SETTING, None)
+        expired_names = parameters._get_expired_datasource_params(default_ttl)
+        if len(expired_names) > 0:
+            _start_parameters_refresh(key, parameters, expired_names)
+    
+    return parameters.copy()
+
+
+def refresh_parameters(dataset: Optional[str] = None) -> List[threading.Thread]:
+    """
+    Rebuilds the options of all data source parameters in the background, regardless of their time-to-live.
+
+    Args:
+        dataset (str): The dataset to refresh. Defaults to all loaded datasets
+
+    Returns:
+        The threads doing the refresh, which can be joined to wait for the new options
+    """
+    with _parameters_lock:
+        items = [(key, parameters) for key, parameters in _parameters_cache.items() if dataset is None or key[1] == dataset]
+    
+    threads = [_start_parameters_refresh(key, parameters, list(parameters._data_source_params)) for key, parameters in items]
+    return [x for x in threads if x is not None]
+
+
+def get_parameters_version(dataset: str) -> int:
+    return _parameters_versions.get(dataset, 0)
 
 
 class Renderer:
-    def __init__(self, dataset, selection_cfg: str = None, lu_data: str = None) -> None:
+    def __init__(self, dataset, selection_cfg: str = None, lu_data: str = None, view_cache: Optional[ResultsCache] = None) -> None:
         # Dynamically import the parameters.py configuration file and convert all datasources parameters
         start = time.time()
         mf.initialize(c.MANIFEST_FILE)
         self.dataset = dataset
         self.input_folder = join_paths(c.DATASETS_FOLDER, dataset)
         self.selection_cfg = get_file_path(self.input_folder, selection_cfg)
+        self.lu_data = lu_data
         self.parameters = load_parameters(self.input_folder, dataset, lu_data)
+        self.selections: Dict[str, str] = {}
         self.job_context = {}
-        c.timer.add_activity_time('initialize Renderer', start)
+        self.view_cache = view_cache
+        timer.add_activity_time('initialize Renderer', start)
+
+    
+    def apply_selections(self, selections: Dict[str, str]):
+        for name, parameter in self.parameters._parameters_dict.items():
+            parameter.refresh(self.parameters)
+            if name in selections:
+                parameter.set_selection(selections[name])
+        self.selections = dict(selections)
 
     
     def get_main_args1(self):
@@ -83,15 +280,46 @@ class Renderer:
         return main_args
     
     
-    def run_final_view_from_python(self, py_file: str, database_views: Dict[str, DataFrame]) -> DataFrame:
+    def run_python_view(self, py_file: str, database_views: Optional[Dict[str, DataFrame]] = None, in_process_pool: bool = False) -> DataFrame:
+        if in_process_pool:
+            # Dataframes are sent as arrow streams, and the worker rebuilds the parameters from the selections
+            serialized_views = {k: serialize_dataframe(v) for k, v in database_views.items()} if database_views is not None else None
+            future = get_process_pool().submit(_run_python_view_in_process, self.dataset, self.lu_data, self.selections, 
+                                               get_parameters_version(self.dataset), py_file, serialized_views)
+            return deserialize_dataframe(future.result())
+        
         main_args = self.get_main_args2()
-        main_args['database_views'] = database_views
+        if database_views is not None:
+            main_args['database_views'] = database_views
         return run_module_main(self.input_folder, py_file, main_args)
 
     
+    def run_final_view_from_python(self, py_file: str, database_views: Dict[str, DataFrame]) -> DataFrame:
+        execution = mf.get_dataset_setting(self.dataset, c.FINAL_VIEW_EXECUTION_SETTING, c.THREAD_EXECUTION)
+        return self.run_python_view(py_file, database_views, in_process_pool=(execution == c.PROCESS_EXECUTION))
+
+    
+    def run_final_view_from_sql(self, final_view_sql_str: str, database_views: Dict[str, DataFrame]) -> DataFrame:
+        engine = mf.get_dataset_setting(self.dataset, c.FINAL_VIEW_ENGINE_SETTING, c.SQLITE_ENGINE)
+        if engine == c.SQLITE_ENGINE:
+            return sqldf(final_view_sql_str, env=database_views)
+        elif engine == c.DUCKDB_ENGINE:
+            try:
+                import duckdb
+            except ImportError:
+                raise RuntimeError(f'The "{c.DUCKDB_ENGINE}" final view engine requires the duckdb package. To install, use: "pip install duckdb"')
+            
+            # DuckDB scans the registered dataframes in place instead of copying them into a database
+            with duckdb.connect() as conn:
+                for view_name, df in database_views.items():
+                    conn.register(view_name, df)
+                return conn.execute(final_view_sql_str).df()
+        else:
+            raise ValueError(f'The setting "{c.FINAL_VIEW_ENGINE_SETTING}" must be "{c.SQLITE_ENGINE}" or "{c.DUCKDB_ENGINE}", not "{engine}"')
+
+    
     def render_view(self, view_file: str) -> str:
-        env = j2.Environment(loader=j2.FileSystemLoader('.'))
-        template = env.get_template(view_file.replace('\\', '/'))
+        template = get_template_env().get_template(view_file.replace('\\', '/'))
         args = {
             'prms': self.parameters.get_parameter_by_name,
             'ctx':  self.get_job_context_by_name,
@@ -111,33 +339,82 @@ class Renderer:
                 output[view_name] = view_file
             else:
                 input_path = get_file_path(self.input_folder, view_file)
-                output[view_name] = self.render_view(input_path)
+                with metrics.span('render', dataset=self.dataset, view=view_name):
+                    output[view_name] = self.render_view(input_path)
         return output
 
 
-    def get_all_results(self, sql_by_view_name: Dict[str, str], final_view_name: str, final_view_sql_str: str = None) -> Tuple[Dict[str, DataFrame], DataFrame]:
-        conn = DbConnection(mf.get_db_profile_name(self.dataset))
+    def get_dataframe_from_query(self, conn: DbConnection, profile_name: str, query: str) -> DataFrame:
+        if self.view_cache is None:
+            return conn.get_dataframe_from_query(query)
         
-        def run_single_query(item: Tuple[str, str]) -> Tuple[str, DataFrame]:
-            view_name, query = item
-            if query.endswith('.py'):
-                return view_name, run_module_main(self.input_folder, query, self.get_main_args2())
-            else:
-                return view_name, conn.get_dataframe_from_query(query)
+        # Cached dataframes are never handed out directly, since python final views may modify their inputs in place
+        key = (profile_name, query)
+        df = self.view_cache.get(key)
+        if df is None:
+            df = conn.get_dataframe_from_query(query)
+            self.view_cache.set(key, df)
+        return df.copy()
+
+
+    def get_view_scheduler(self) -> ViewScheduler:
+        dataset_parms = mf.get_dataset_parms(self.dataset)
+        dependencies = {x[c.DB_VIEW_NAME_KEY]: x.get(c.DB_VIEW_DEPENDS_ON_KEY, []) for x in dataset_parms[c.DATABASE_VIEWS_KEY]}
+        return ViewScheduler(dependencies)
+
+
+    def get_views_used_by_final_view(self, view_names: List[str], final_view_name: str, final_view_sql_str: str = None) -> List[str]:
+        if final_view_name in view_names:
+            return [final_view_name]
+        elif final_view_sql_str is not None:
+            return [x for x in view_names if re.search(rf'\b{re.escape(x)}\b', final_view_sql_str, re.IGNORECASE)]
+        else:
+            return view_names
+
+
+    def get_all_results(self, sql_by_view_name: Dict[str, str], final_view_name: str, final_view_sql_str: str = None, 
+                        run_unused_views: bool = False) -> Tuple[Dict[str, DataFrame], DataFrame]:
+        profile_name = mf.get_db_profile_name(self.dataset)
+        conn = DbConnection(profile_name)
+        
+        dataset_parms = mf.get_dataset_parms(self.dataset)
+        execution_by_view_name = {x[c.DB_VIEW_NAME_KEY]: x.get(c.DB_VIEW_EXECUTION_KEY, c.THREAD_EXECUTION) for x in dataset_parms[c.DATABASE_VIEWS_KEY]}
+        
+        def run_single_query(view_name: str, upstream_dfs: Dict[str, DataFrame]) -> DataFrame:
+            query = sql_by_view_name[view_name]
+            with metrics.span('database_view', dataset=self.dataset, view=view_name):
+                if query.endswith('.py'):
+                    database_views = upstream_dfs if len(upstream_dfs) > 0 else None
+                    in_process_pool = (execution_by_view_name.get(view_name) == c.PROCESS_EXECUTION)
+                    df = self.run_python_view(query, database_views, in_process_pool)
+                else:
+                    df = self.get_dataframe_from_query(conn, profile_name, query)
+                metrics.record_rows(len(df))
+            return df
         
         start = time.time()
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            df_by_view_name = dict(executor.map(run_single_query, sql_by_view_name.items()))
-        c.timer.add_activity_time('run database views', start)
+        scheduler = self.get_view_scheduler()
+        view_names = list(sql_by_view_name)
+        if not run_unused_views:
+            view_names = self.get_views_used_by_final_view(view_names, final_view_name, final_view_sql_str)
+        df_by_view_name = scheduler.run(run_single_query, view_names, get_executor(c.VIEWS_EXECUTOR))
+        timer.add_activity_time('run database views', start)
+        
+        critical_path, critical_path_time = scheduler.get_critical_path()
+        if len(critical_path) > 0:
+            timer.get_timer().add_time(f'database views critical path ({" -> ".join(critical_path)})', critical_path_time * 10**3)
         
         start = time.time()
         if final_view_name in sql_by_view_name:
             final_df = df_by_view_name[final_view_name]
-        elif final_view_name.endswith('.py'):
-            final_df = self.run_final_view_from_python(final_view_name, df_by_view_name)
         else:
-            final_df = sqldf(final_view_sql_str, env=df_by_view_name)
-        c.timer.add_activity_time('run final view', start)
+            with metrics.span('final_view', dataset=self.dataset, view=c.FINAL_VIEW_NAME):
+                if final_view_name.endswith('.py'):
+                    final_df = self.run_final_view_from_python(final_view_name, df_by_view_name)
+                else:
+                    final_df = self.run_final_view_from_sql(final_view_sql_str, df_by_view_name)
+                metrics.record_rows(len(final_df))
+        timer.add_activity_time('run final view', start)
         
         return df_by_view_name, final_df
     
@@ -146,10 +423,34 @@ class Renderer:
         final_view_sql_str = None
         if final_view_name not in database_view_names and not final_view_name.endswith('.py'):
             final_view_path = get_file_path(self.input_folder, final_view_name)
-            final_view_sql_str = self.render_view(final_view_path)
+            with metrics.span('render', dataset=self.dataset, view=c.FINAL_VIEW_NAME):
+                final_view_sql_str = self.render_view(final_view_path)
         return final_view_sql_str
     
 
+    def warm_up(self):
+        """
+        Imports the python files and compiles the templates of the dataset, so the first request does not pay for them.
+        """
+        dataset_parms = mf.get_dataset_parms(self.dataset)
+        view_files = [x[c.DB_VIEW_FILE_KEY] for x in dataset_parms[c.DATABASE_VIEWS_KEY]]
+        database_view_names = [x[c.DB_VIEW_NAME_KEY] for x in dataset_parms[c.DATABASE_VIEWS_KEY]]
+        final_view_name = dataset_parms[c.FINAL_VIEW_KEY]
+        if final_view_name not in database_view_names:
+            view_files.append(final_view_name)
+        
+        # The context file is optional, but the view files are not
+        if os.path.exists(join_paths(self.input_folder, c.CONTEXT_FILE)):
+            view_files.insert(0, c.CONTEXT_FILE)
+        
+        for view_file in view_files:
+            file_path = get_file_path(self.input_folder, view_file)
+            if view_file.endswith('.py'):
+                load_module(file_path)
+            else:
+                get_template_env().get_template(file_path.replace('\\', '/'))
+    
+
     def write_outputs(self, runquery: bool):
         # Apply selections from selections.cfg
         start = time.time()
@@ -157,17 +458,13 @@ class Renderer:
             config = ConfigParser()
             config.read(self.selection_cfg)
             if config.has_section(c.PARAMETERS_SECTION):
-                config_section = config[c.PARAMETERS_SECTION]
-                for name, parameter in self.parameters._parameters_dict.items():
-                    parameter.refresh(self.parameters)
-                    if name in config_section:
-                        parameter.set_selection(config_section[name])
-        c.timer.add_activity_time('apply selections', start)
+                self.apply_selections(dict(config[c.PARAMETERS_SECTION]))
+        timer.add_activity_time('apply selections', start)
 
         # Set context
         start = time.time()
         self.set_job_context()
-        c.timer.add_activity_time('set job context', start)
+        timer.add_activity_time('set job context', start)
 
         # Clear output folder contents and write the parameters metadata to file
         start = time.time()
@@ -183,7 +480,7 @@ class Renderer:
         parameters_outfile = join_paths(output_folder, c.PARAMETERS_OUTPUT)
         with open(parameters_outfile, 'w') as f:
             json.dump(self.parameters._to_dict(), f, indent=4)
-        c.timer.add_activity_time('write parameters', start)
+        timer.add_activity_time('write parameters', start)
         
         # Render and write the sql queries
         start = time.time()
@@ -203,12 +500,12 @@ class Renderer:
         final_view_sql_str = self.get_final_view_sql_str(final_view_name, sql_by_view_name)
         if final_view_sql_str is not None:
             write_sql_file(c.FINAL_VIEW_NAME, final_view_sql_str)
-        c.timer.add_activity_time('write sql files', start)
+        timer.add_activity_time('write sql files', start)
 
         # Run the sql queries and write output
         if runquery:
             start = time.time()
-            df_by_view_name, final_df = self.get_all_results(sql_by_view_name, final_view_name, final_view_sql_str)
+            df_by_view_name, final_df = self.get_all_results(sql_by_view_name, final_view_name, final_view_sql_str, run_unused_views=True)
             
             for view_name, df in df_by_view_name.items():
                 csv_file = join_paths(output_folder, view_name+'.csv')
@@ -219,7 +516,7 @@ class Renderer:
 
             final_json_path = join_paths(output_folder, c.FINAL_VIEW_NAME+'.json')
             final_df.to_json(final_json_path, orient='table', index=False, indent=4)
-            c.timer.add_activity_time('query and write results', start)
+            timer.add_activity_time('query and write results', start)
 
         # Print status
         print(f'Outputs written! See the "{output_folder}" folder for output files')
@@ -0,0 +1,258 @@
+import os, sys, time, pickle, hashlib, threading, warnings
+from typing import Dict, Hashable, Optional, Any
+from cachetools import TTLCache
+from squirrels import constants as c, manifest as mf, timer
+
+start = time.time()
+import pandas as pd
+timer.add_activity_time(c.IMPORT_PANDAS, start)
+
+
+def get_size_in_bytes(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    elif isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    else:
+        return sys.getsizeof(value)
+
+
+def _canonicalize_key(key: Hashable):
+    if isinstance(key, (frozenset, set)):
+        return sorted((_canonicalize_key(x) for x in key), key=repr)
+    elif isinstance(key, tuple):
+        return tuple(_canonicalize_key(x) for x in key)
+    else:
+        return key
+
+
+def get_key_digest(key: Hashable) -> str:
+    """
+    Gets a digest of a cache key that is stable across processes (unlike the builtin hash of strings and frozensets).
+
+    Args:
+        key (Hashable): A cache key made of tuples, frozensets and primitive values.
+
+    Returns:
+        A hex string
+    """
+    return hashlib.sha256(repr(_canonicalize_key(key)).encode('utf-8')).hexdigest()
+
+
+class ResultsCache:
+    def __init__(self):
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        raise RuntimeError(f'Must override "get" method in all classes that override the "{self.__class__.__name__}" class')
+
+    def set(self, key: Hashable, value: Any):
+        raise RuntimeError(f'Must override "set" method in all classes that override the "{self.__class__.__name__}" class')
+
+    def clear(self):
+        raise RuntimeError(f'Must override "clear" method in all classes that override the "{self.__class__.__name__}" class')
+
+    def _record_lookup(self, value: Optional[Any]) -> Optional[Any]:
+        if value is None:
+            self.num_misses += 1
+        else:
+            self.num_hits += 1
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': self.__class__.__name__, 'hits': self.num_hits, 'misses': self.num_misses}
+
+
+class MemoryCache(ResultsCache):
+    def __init__(self, max_bytes: int, ttl: float, max_entries: Optional[int] = None):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._cache = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=get_size_in_bytes)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._cache.get(key)
+        return self._record_lookup(value)
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            if self.max_entries is not None and key not in self._cache:
+                self._cache.expire()
+                while len(self._cache) >= self.max_entries:
+                    self._cache.popitem() # least recently used
+            try:
+                self._cache[key] = value
+            except ValueError:
+                pass # value is larger than the entire cache, so it is not cached
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        output = super().get_stats()
+        output['entries'] = len(self._cache)
+        output['bytes'] = self._cache.currsize
+        output['max_bytes'] = self.max_bytes
+        output['max_entries'] = self.max_entries
+        return output
+
+
+class DiskCache(ResultsCache):
+    """
+    Cache of files in a directory. DataFrames are stored as parquet files (if pyarrow is installed) and other values
+    are pickled. Files are written atomically, so multiple worker processes can share the same directory.
+    """
+    _PARQUET_EXT = '.parquet'
+    _PICKLE_EXT = '.pkl'
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        super().__init__()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, key: Hashable, extension: str) -> str:
+        return os.path.join(self.directory, get_key_digest(key) + extension)
+
+    def _is_expired(self, path: str) -> bool:
+        return time.time() - os.path.getmtime(path) > self.ttl
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = None
+        for extension in (self._PARQUET_EXT, self._PICKLE_EXT):
+            path = self._get_path(key, extension)
+            try:
+                if self._is_expired(path):
+                    os.remove(path)
+                elif extension == self._PARQUET_EXT:
+                    value = pd.read_parquet(path)
+                else:
+                    with open(path, 'rb') as f:
+                        value = pickle.load(f)
+            except FileNotFoundError:
+                continue # another worker may have evicted the file
+            break
+        return self._record_lookup(value)
+
+    def set(self, key: Hashable, value: Any):
+        if get_size_in_bytes(value) > self.max_bytes:
+            return
+
+        temp_path = os.path.join(self.directory, f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            value.to_parquet(temp_path)
+            extension = self._PARQUET_EXT
+        except (AttributeError, ImportError, ValueError, TypeError):
+            with open(temp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            extension = self._PICKLE_EXT
+        os.replace(temp_path, self._get_path(key, extension))
+        self._evict()
+
+    def _get_cache_files(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                yield entry
+
+    def _evict(self):
+        files = []
+        for entry in self._get_cache_files():
+            try:
+                files.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+            except FileNotFoundError:
+                pass
+
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        for entry in self._get_cache_files():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        output = super().get_stats()
+        sizes = [entry.stat().st_size for entry in self._get_cache_files()]
+        output['entries'] = len(sizes)
+        output['bytes'] = sum(sizes)
+        output['max_bytes'] = self.max_bytes
+        output['directory'] = self.directory
+        return output
+
+
+class TieredCache(ResultsCache):
+    def __init__(self, memory_cache: MemoryCache, disk_cache: DiskCache):
+        super().__init__()
+        self.memory_cache = memory_cache
+        self.disk_cache = disk_cache
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self.memory_cache.get(key)
+        if value is None:
+            value = self.disk_cache.get(key)
+            if value is not None:
+                self.memory_cache.set(key, value)
+        return self._record_lookup(value)
+
+    def set(self, key: Hashable, value: Any):
+        self.memory_cache.set(key, value)
+        self.disk_cache.set(key, value)
+
+    def clear(self):
+        self.memory_cache.clear()
+        self.disk_cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        output = super().get_stats()
+        output['memory'] = self.memory_cache.get_stats()
+        output['disk'] = self.disk_cache.get_stats()
+        return output
+
+
+def create_results_cache(ttl: float) -> ResultsCache:
+    """
+    Creates the results cache backend configured in the manifest settings.
+
+    Args:
+        ttl (float): Number of seconds before a cached value expires.
+
+    Returns:
+        A ResultsCache
+    """
+    backend = mf.get_setting(c.RESULTS_CACHE_BACKEND_SETTING, 'memory')
+
+    # The deprecated entry limit is still honored (alongside the size limit) for existing projects
+    max_entries = mf.get_setting(c.RESULTS_CACHE_SIZE_SETTING, None)
+    if max_entries is not None:
+        warnings.warn(f'The setting "{c.RESULTS_CACHE_SIZE_SETTING}" is deprecated and only limits the number of entries. ' + 
+                      f'Use "{c.RESULTS_CACHE_MAX_BYTES_SETTING}" to limit the size of the results cache instead', FutureWarning)
+
+    def create_memory_cache():
+        return MemoryCache(mf.get_setting(c.RESULTS_CACHE_MAX_BYTES_SETTING, 512*2**20), ttl, max_entries)
+
+    def create_disk_cache():
+        directory = mf.get_setting(c.RESULTS_CACHE_DIR_SETTING, os.path.join(c.CACHE_FOLDER, 'results'))
+        return DiskCache(directory, mf.get_setting(c.RESULTS_CACHE_DISK_MAX_BYTES_SETTING, 4*2**30), ttl)
+
+    if backend == 'memory':
+        return create_memory_cache()
+    elif backend == 'disk':
+        return create_disk_cache()
+    elif backend == 'tiered':
+        return TieredCache(create_memory_cache(), create_disk_cache())
+    else:
+        raise ValueError(f'The setting "{c.RESULTS_CACHE_BACKEND_SETTING}" must be one of "memory", "disk" or "tiered", not "{backend}"')
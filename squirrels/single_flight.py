@@ -0,0 +1,40 @@
+import asyncio
+from typing import Dict, Hashable, Callable, Awaitable, Any
+
+
+class SingleFlight:
+    def __init__(self):
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.num_requests = 0
+        self.num_coalesced = 0
+
+    async def run(self, key: Hashable, coro_func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs the coroutine function for a key, unless a run for the same key is already in flight, in which case
+        the result of that run is awaited instead.
+
+        Args:
+            key (Hashable): Identifies the computation (e.g. dataset and query parameters).
+            coro_func (Callable): Function that returns the awaitable to run if nothing is in flight for the key.
+
+        Returns:
+            The result of the shared computation. Exceptions are propagated to all awaiting callers.
+        """
+        self.num_requests += 1
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(coro_func())
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.num_coalesced += 1
+        
+        # Shielded so that one cancelled caller (e.g. a client disconnect) does not cancel the others
+        return await asyncio.shield(future)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'requests': self.num_requests,
+            'coalesced': self.num_coalesced,
+            'in_flight': len(self.in_flight)
+        }
@@ -6,11 +6,20 @@ const resultTable = document.getElementById("result-table");
 const tableHeader = document.getElementById('table-header');
 const tableBody = document.getElementById('table-body');
 
+const previousPageButton = document.getElementById('previous-page');
+const nextPageButton = document.getElementById('next-page');
+const pageLabel = document.getElementById('page-label');
+
 const loadingIndicator = document.getElementById('loading-indicator');
 
 const datasetsMap = new Map();
 const parametersMap = new Map();
 
+// Results are requested one page at a time, so only the rows on screen are transferred
+const resultsPageSize = 100;
+let resultsRequest = '';
+let resultsOffset = 0;
+
 function callJsonAPI(path, func) {
     loadingIndicator.style.display = 'flex';
     fetch(path)
@@ -173,10 +182,26 @@ function getQueryParams() {
 function getDatasetResults() {
     const selectedDatasetValue = datasetSelect.value;
     const resultPath = datasetsMap.get(selectedDatasetValue).result_path;
-    const resultRequest = resultPath + '?' + getQueryParams()
+    resultsRequest = resultPath + '?' + getQueryParams()
+    getResultsPage(0)
+}
+
+function changeResultsPage(direction) {
+    getResultsPage(Math.max(resultsOffset + direction * resultsPageSize, 0))
+}
+
+function getResultsPage(offset) {
+    const pageParams = new URLSearchParams({limit: resultsPageSize, offset: offset})
+    const resultRequest = resultsRequest + '&' + pageParams
     console.log('Result request:', resultRequest)
 
     callJsonAPI(resultRequest, (jsonResponse) => {
+        resultsOffset = offset
+        const numRows = jsonResponse.data.length
+        pageLabel.textContent = numRows > 0 ? `Rows ${offset + 1} - ${offset + numRows}` : 'No rows'
+        previousPageButton.disabled = (offset === 0)
+        nextPageButton.disabled = (numRows < resultsPageSize)
+
         tableHeader.innerHTML = ''
         tableBody.innerHTML = ''
 
@@ -0,0 +1,128 @@
+import re, json, math, time, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+
+class Timer:
+    def __init__(self):
+        """
+        Constructor for Timer, which collects the durations of named (and possibly nested) activities for one unit of
+        work, such as a CLI command or an API request. It is safe to use from multiple threads.
+        """
+        self._times: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, activity: str, elapsed_ms: float):
+        name = ' > '.join(_span_path.get() + (activity,))
+        with self._lock:
+            self._times.setdefault(name, []).append(elapsed_ms)
+
+    def add_activity_time(self, activity: str, my_start: float):
+        self.add_time(activity, (time.time() - my_start) * 10**3)
+
+    @contextmanager
+    def span(self, activity: str):
+        """
+        Times the activity of a with-block. Activities timed inside the block are recorded as its children, with names
+        like "parent > child".
+
+        Args:
+            activity (str): The name of the activity
+        """
+        token = _span_path.set(_span_path.get() + (activity,))
+        start = time.time()
+        try:
+            yield
+        finally:
+            _span_path.reset(token)
+            self.add_activity_time(activity, start)
+
+    def get_summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Gets the statistics of the durations of each activity, in milliseconds.
+
+        Returns:
+            A dictionary of activity name to the count, total, median, 90th/99th percentile and max duration
+        """
+        def percentile(sorted_times: List[float], fraction: float) -> float:
+            return sorted_times[max(math.ceil(fraction * len(sorted_times)) - 1, 0)]
+
+        with self._lock:
+            items = [(name, sorted(times)) for name, times in self._times.items()]
+
+        output = {}
+        for name, times in items:
+            output[name] = {
+                'count': len(times), 'total_ms': sum(times), 'p50_ms': percentile(times, 0.5),
+                'p90_ms': percentile(times, 0.9), 'p99_ms': percentile(times, 0.99), 'max_ms': times[-1]
+            }
+        return output
+
+    def report_times(self, verbose: bool):
+        if verbose:
+            for activity, stats in self.get_summary().items():
+                message = f'The time of execution of "{activity}" is: {stats["total_ms"]} ms'
+                if stats['count'] > 1:
+                    message += f' (count: {stats["count"]}, p50: {stats["p50_ms"]:.1f} ms, p90: {stats["p90_ms"]:.1f} ms, max: {stats["max_ms"]:.1f} ms)'
+                print(message)
+
+    def get_server_timing(self) -> str:
+        """
+        Gets the total duration of each activity in the format of a "Server-Timing" http header.
+
+        Returns:
+            The header value
+        """
+        metrics = []
+        for i, (activity, stats) in enumerate(self.get_summary().items()):
+            token = re.sub(r'[^A-Za-z0-9_\-]', '_', activity) + f'_{i}'
+            description = activity.replace('\\', '\\\\').replace('"', '\\"')
+            metrics.append(f'{token};dur={stats["total_ms"]:.1f};desc="{description}"')
+        return ', '.join(metrics)
+
+    def get_summary_json(self) -> str:
+        summary = {name: {k: round(v, 3) for k, v in stats.items()} for name, stats in self.get_summary().items()}
+        return json.dumps(summary, separators=(',', ':'))
+
+
+_process_timer = Timer()
+_current_timer: ContextVar[Timer] = ContextVar('squirrels_timer', default=_process_timer)
+_span_path: ContextVar[Tuple[str, ...]] = ContextVar('squirrels_timer_span_path', default=())
+
+
+def get_timer() -> Timer:
+    """
+    Gets the timer of the current context. This is the timer of the current API request, or the timer of the process
+    (used by the CLI and at import time) outside of any request.
+
+    Returns:
+        A Timer
+    """
+    return _current_timer.get()
+
+
+@contextmanager
+def new_timer():
+    """
+    Uses a new timer for the with-block (and the executor tasks submitted from it).
+
+    Returns:
+        A context manager that yields the new Timer
+    """
+    timer = Timer()
+    timer_token = _current_timer.set(timer)
+    path_token = _span_path.set(())
+    try:
+        yield timer
+    finally:
+        _span_path.reset(path_token)
+        _current_timer.reset(timer_token)
+
+
+def add_activity_time(activity: str, my_start: float):
+    get_timer().add_activity_time(activity, my_start)
+
+
+def span(activity: str):
+    return get_timer().span(activity)
@@ -0,0 +1,116 @@
+import time
+import concurrent.futures
+from typing import Dict, List, Set, Tuple, Iterable, Callable, Any
+
+
+class ViewScheduler:
+    def __init__(self, dependencies: Dict[str, List[str]]):
+        """
+        Constructor for ViewScheduler, which runs views in dependency order.
+
+        Args:
+            dependencies (Dict[str, List[str]]): The names of the views that each view depends on. Every view must be a key.
+        """
+        self.dependencies = dependencies
+        for view_name, upstream_views in dependencies.items():
+            for upstream_view in upstream_views:
+                if upstream_view not in dependencies:
+                    raise ValueError(f'The database view "{view_name}" depends on "{upstream_view}", which is not a database view')
+        self._verify_no_cycles()
+        self.view_times: Dict[str, Tuple[float, float]] = {}
+
+    def _verify_no_cycles(self):
+        visited, in_progress = set(), set()
+
+        def visit(view_name: str, path: List[str]):
+            if view_name in in_progress:
+                cycle = path[path.index(view_name):] + [view_name]
+                raise ValueError(f'The database views have a circular dependency: {" -> ".join(cycle)}')
+            if view_name not in visited:
+                in_progress.add(view_name)
+                for upstream_view in self.dependencies[view_name]:
+                    visit(upstream_view, path + [view_name])
+                in_progress.remove(view_name)
+                visited.add(view_name)
+
+        for view_name in self.dependencies:
+            visit(view_name, [])
+
+    def get_required_views(self, target_views: Iterable[str]) -> Set[str]:
+        required = set()
+        stack = list(target_views)
+        while len(stack) > 0:
+            view_name = stack.pop()
+            if view_name not in required:
+                required.add(view_name)
+                stack.extend(self.dependencies[view_name])
+        return required
+
+    def run(self, run_view: Callable[[str, Dict[str, Any]], Any], view_names: Iterable[str],
+            executor: concurrent.futures.Executor) -> Dict[str, Any]:
+        """
+        Runs the views (and the views they depend on), starting each one as soon as its dependencies have finished.
+
+        Args:
+            run_view (Callable): Function that takes a view name and the results of its dependencies, and returns its result
+            view_names (Iterable[str]): The views to run
+            executor (Executor): The executor that runs independent views in parallel
+
+        Returns:
+            A dictionary of view name to result for all views that ran
+        """
+        remaining = self.get_required_views(view_names)
+        num_pending_upstream = {x: len(self.dependencies[x]) for x in remaining}
+        downstream_views: Dict[str, List[str]] = {x: [] for x in remaining}
+        for view_name in remaining:
+            for upstream_view in self.dependencies[view_name]:
+                downstream_views[upstream_view].append(view_name)
+
+        results: Dict[str, Any] = {}
+        self.view_times = {}
+        start = time.time()
+
+        def run_with_timing(view_name: str, upstream_results: Dict[str, Any]) -> Any:
+            view_start = time.time() - start
+            result = run_view(view_name, upstream_results)
+            self.view_times[view_name] = (view_start, time.time() - start)
+            return result
+
+        def submit(view_name: str) -> concurrent.futures.Future:
+            upstream_results = {x: results[x] for x in self.dependencies[view_name]}
+            return executor.submit(run_with_timing, view_name, upstream_results)
+
+        futures = {submit(x): x for x, count in num_pending_upstream.items() if count == 0}
+        try:
+            while len(futures) > 0:
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    view_name = futures.pop(future)
+                    results[view_name] = future.result()
+                    for downstream_view in downstream_views[view_name]:
+                        num_pending_upstream[downstream_view] -= 1
+                        if num_pending_upstream[downstream_view] == 0:
+                            futures[submit(downstream_view)] = downstream_view
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return results
+
+    def get_critical_path(self) -> Tuple[List[str], float]:
+        """
+        Gets the chain of dependent views that determined the total run time of the last run.
+
+        Returns:
+            A tuple of the view names in the chain (in run order) and the time in seconds until the last one finished
+        """
+        if len(self.view_times) == 0:
+            return [], 0
+
+        view_name = max(self.view_times, key=lambda x: self.view_times[x][1])
+        total_time = self.view_times[view_name][1]
+        path = [view_name]
+        while len(self.dependencies[view_name]) > 0:
+            view_name = max(self.dependencies[view_name], key=lambda x: self.view_times[x][1])
+            path.append(view_name)
+        return list(reversed(path)), total_time
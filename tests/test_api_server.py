@@ -0,0 +1,262 @@
+from fastapi.testclient import TestClient
+from squirrels import api_server, major_version
+import pandas as pd
+import pytest, os, json, io, time, asyncio, threading
+
+
+def create_client(monkeypatch, no_cache: bool, debug: bool = False) -> TestClient:
+    monkeypatch.syspath_prepend(os.path.abspath('sample_project'))
+    monkeypatch.chdir('sample_project')
+    return TestClient(api_server.create_app(no_cache=no_cache, debug_value=debug))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    return create_client(monkeypatch, no_cache=True)
+
+
+base_path = f'/squirrels{major_version}/myproduct/v0'
+
+
+def test_get_results(client: TestClient):
+    response = client.get(base_path + '/stock-price-history', params={'ticker': '0,1'})
+    assert(response.status_code == 200)
+    tickers = {row['ticker'] for row in response.json()['data']}
+    assert(tickers == {'AAPL', 'AMZN'})
+
+
+def test_dataset_concurrency_limit(client: TestClient, monkeypatch):
+    dataset_parms = api_server.mf.get_dataset_parms('stock_price_history')
+    monkeypatch.setitem(dataset_parms, 'settings', {'results.max_concurrency': 2})
+    counts = {'running': 0, 'max_running': 0}
+    lock = threading.Lock()
+
+    def helper_func(dataset: str):
+        with lock:
+            counts['running'] += 1
+            counts['max_running'] = max(counts['max_running'], counts['running'])
+        time.sleep(0.05)
+        with lock:
+            counts['running'] -= 1
+
+    async def run_requests():
+        requests = [api_server.run_with_dataset_limit(helper_func, 'stock_price_history') for _ in range(6)]
+        await asyncio.gather(*requests)
+    
+    asyncio.run(run_requests())
+    assert(counts['max_running'] == 2)
+
+
+def test_get_results_cached(monkeypatch):
+    client = create_client(monkeypatch, no_cache=False)
+    response1 = client.get(base_path + '/stock-price-history', params={'ticker': '2'})
+    response2 = client.get(base_path + '/stock-price-history', params={'ticker': '2'})
+    assert(response1.content == response2.content)
+    assert(response1.headers['content-type'] == 'application/json')
+
+    cache_stats = client.get(f'/squirrels{major_version}/stats').json()['results_cache']
+    assert(cache_stats['hits'] == 1 and cache_stats['misses'] == 1)
+
+
+def test_get_results_streaming_formats(client: TestClient):
+    params = {'ticker': '0,1'}
+    expected = client.get(base_path + '/stock-price-history', params=params).json()['data']
+
+    response = client.get(base_path + '/stock-price-history', params={**params, 'format': 'ndjson'})
+    assert(response.headers['content-type'].startswith('application/x-ndjson'))
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert(rows == expected)
+
+    response = client.get(base_path + '/stock-price-history', params={**params, 'format': 'csv'})
+    lines = response.text.splitlines()
+    assert(lines[0].split(',') == list(expected[0].keys()))
+    assert(len(lines) == len(expected) + 1)
+
+    response = client.get(base_path + '/stock-price-history', params={**params, 'format': 'xml'})
+    assert(response.status_code == 400)
+
+
+def test_streaming_holds_dataset_limit(client: TestClient, monkeypatch):
+    dataset_parms = api_server.mf.get_dataset_parms('stock_price_history')
+    monkeypatch.setitem(dataset_parms, 'settings', {'results.max_concurrency': 1})
+    locked_while_streaming = []
+    encode_dataframe_chunks = api_server.encode_dataframe_chunks
+
+    def encode_and_check_limit(df_chunks, format):
+        for chunk in encode_dataframe_chunks(df_chunks, format):
+            locked_while_streaming.append(api_server.get_dataset_semaphore('stock_price_history').locked())
+            yield chunk
+    
+    monkeypatch.setattr(api_server, 'encode_dataframe_chunks', encode_and_check_limit)
+    response = client.get(base_path + '/stock-price-history', params={'ticker': '0', 'format': 'ndjson'})
+    assert(response.status_code == 200)
+    assert(len(locked_while_streaming) > 0 and all(locked_while_streaming))
+    assert(not api_server.get_dataset_semaphore('stock_price_history').locked())
+
+
+def test_streaming_database_final_view(client: TestClient, monkeypatch):
+    dataset_parms = api_server.mf.get_dataset_parms('stock_price_history')
+    monkeypatch.setitem(dataset_parms, 'final_view', 'ticker_history')
+    monkeypatch.setitem(api_server.mf.parms, 'settings', {'results.stream.chunk_size': 5})
+    params = {'ticker': '0,1'}
+    expected = client.get(base_path + '/stock-price-history', params=params).json()['data']
+    assert(len(expected) > 10)
+
+    # Each chunk is fetched from the same database cursor (and thread) as the first one
+    response = client.get(base_path + '/stock-price-history', params={**params, 'format': 'ndjson'})
+    assert(response.status_code == 200)
+    assert([json.loads(line) for line in response.text.splitlines()] == expected)
+
+
+def test_streaming_closes_chunks_on_disconnect(client: TestClient):
+    closed = threading.Event()
+    def generate_chunks():
+        try:
+            for i in range(100):
+                yield f'{i}\n'
+        finally:
+            closed.set()
+    
+    async def stream_until_disconnect():
+        semaphore = asyncio.Semaphore(1)
+        await semaphore.acquire()
+        response = api_server.DatasetLimitedStreamingResponse(generate_chunks(), semaphore, 'text/plain')
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                raise OSError('client disconnected')
+        with pytest.raises(Exception):
+            await response({'type': 'http', 'asgi': {'spec_version': '2.4'}}, None, send)
+        return semaphore
+    
+    semaphore = asyncio.run(stream_until_disconnect())
+    assert(not semaphore.locked())
+    assert(closed.wait(timeout=10))
+
+
+def test_streaming_runs_final_view_dependencies(client: TestClient, monkeypatch):
+    dataset_parms = api_server.mf.get_dataset_parms('stock_price_history')
+    database_views = [
+        {'name': 'ticker_history', 'file': 'ticker_history.sql.j2', 'depends_on': ['upstream_view']},
+        {'name': 'upstream_view', 'file': 'ticker_history.sql.j2'}
+    ]
+    monkeypatch.setitem(dataset_parms, 'database_views', database_views)
+    monkeypatch.setitem(dataset_parms, 'final_view', 'ticker_history')
+    views_run = []
+    get_dataframe_from_query = api_server.Renderer.get_dataframe_from_query
+    def record_query(self, conn, profile_name, query):
+        views_run.append(query)
+        return get_dataframe_from_query(self, conn, profile_name, query)
+    monkeypatch.setattr(api_server.Renderer, 'get_dataframe_from_query', record_query)
+
+    response = client.get(base_path + '/stock-price-history', params={'ticker': '0', 'format': 'ndjson'})
+    assert(response.status_code == 200 and len(response.text.splitlines()) > 0)
+    assert(len(views_run) == 2)
+
+
+def test_get_results_arrow_formats(client: TestClient):
+    pa = pytest.importorskip('pyarrow')
+    params = {'ticker': '0,1'}
+    expected = pd.DataFrame(client.get(base_path + '/stock-price-history', params=params).json()['data'])
+
+    response = client.get(base_path + '/stock-price-history', params={**params, 'format': 'parquet'})
+    assert(response.headers['content-type'] == 'application/vnd.apache.parquet')
+    pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(response.content)), expected)
+    
+    response = client.get(base_path + '/stock-price-history', params=params, headers={'Accept': 'application/vnd.apache.arrow.stream'})
+    assert(response.headers['content-type'] == 'application/vnd.apache.arrow.stream')
+    pd.testing.assert_frame_equal(pa.ipc.open_stream(response.content).read_pandas(), expected)
+
+
+def test_get_results_page(client: TestClient):
+    params = {'ticker': '0,1'}
+    all_rows = client.get(base_path + '/stock-price-history', params=params).json()['data']
+
+    response = client.get(base_path + '/stock-price-history', params={**params, 'limit': '5', 'offset': '10', 'columns': 'ticker'})
+    rows = response.json()['data']
+    assert(rows == [{'ticker': x['ticker']} for x in all_rows[10:15]])
+
+    response = client.get(base_path + '/stock-price-history', params={**params, 'offset': '10', 'format': 'csv'})
+    assert(len(response.text.splitlines()) == len(all_rows) - 10 + 1)
+
+    response = client.get(base_path + '/stock-price-history', params={**params, 'columns': 'not_a_column'})
+    assert(response.status_code == 400)
+    response = client.get(base_path + '/stock-price-history', params={**params, 'limit': '-1'})
+    assert(response.status_code == 400)
+
+
+def test_warm_up_results(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.abspath('sample_project'))
+    monkeypatch.chdir('sample_project')
+    client = TestClient(api_server.create_app(no_cache=False, debug_value=False, warm_up_results=True))
+    stats = client.get(f'/squirrels{major_version}/stats').json()
+    assert(set(stats['warm_up_seconds']) == {'stock_price_history'})
+
+    client.get(base_path + '/stock-price-history')
+    assert(client.get(f'/squirrels{major_version}/stats').json()['results_cache']['hits'] == 1)
+
+
+def test_refresh_parameters(monkeypatch):
+    client = create_client(monkeypatch, no_cache=True, debug=True)
+    parameters_path = base_path + '/stock-price-history/parameters'
+    assert(client.get(parameters_path).status_code == 200)
+    version = api_server.get_parameters_version('stock_price_history')
+    
+    response = client.post(f'/squirrels{major_version}/admin/parameters/refresh', params={'dataset': 'stock-price-history'})
+    assert(response.json() == {'refreshing': 1})
+    deadline = time.time() + 10
+    while api_server.get_parameters_version('stock_price_history') == version and time.time() < deadline:
+        time.sleep(0.01)
+    assert(api_server.get_parameters_version('stock_price_history') == version + 1)
+    assert(client.get(parameters_path).status_code == 200)
+
+    response = client.post(f'/squirrels{major_version}/admin/parameters/refresh', params={'dataset': 'no-such-dataset'})
+    assert(response.status_code == 404)
+
+
+def test_reload_modules(monkeypatch):
+    client = create_client(monkeypatch, no_cache=True, debug=True)
+    assert(client.get(base_path + '/stock-price-history').status_code == 200)
+    response = client.post(f'/squirrels{major_version}/admin/modules/reload')
+    assert(response.json()['reloaded'] > 0)
+    assert(client.post(f'/squirrels{major_version}/admin/modules/reload').json() == {'reloaded': 0})
+
+
+def test_refresh_parameters_requires_admin_access(client: TestClient, monkeypatch):
+    refresh_path = f'/squirrels{major_version}/admin/parameters/refresh'
+    assert(client.post(refresh_path).status_code == 403)
+
+    monkeypatch.setitem(api_server.mf.parms, 'settings', {'admin.token': 'secret'})
+    client = TestClient(api_server.create_app(no_cache=True, debug_value=False))
+    assert(client.post(refresh_path).status_code == 401)
+    assert(client.post(refresh_path, headers={'Authorization': 'Bearer wrong'}).status_code == 401)
+    assert(client.post(refresh_path, headers={'Authorization': 'Bearer secret'}).status_code == 200)
+
+
+def test_get_metrics(client: TestClient):
+    client.get(base_path + '/stock-price-history', params={'ticker': '0'})
+    response = client.get('/metrics')
+    assert(response.status_code == 200)
+    assert('squirrels_stage_duration_seconds_count{dataset="stock_price_history",view="ticker_history",stage="fetch"}' in response.text)
+    assert('squirrels_view_rows_count{dataset="stock_price_history",view="final_view"}' in response.text)
+    assert('squirrels_response_bytes_count{dataset="stock_price_history",format="json"}' in response.text)
+    assert(f'squirrels_request_duration_seconds_count{{route="{base_path}/{{dataset}}",method="GET",status="200"}}' in response.text)
+
+
+def test_unknown_dataset_not_in_metrics(client: TestClient):
+    assert(client.get(base_path + '/garbage-0', params={'ticker': '0'}).status_code == 404)
+    assert(client.get(base_path + '/garbage-0/parameters').status_code == 404)
+    assert('garbage_0' not in client.get('/metrics').text)
+
+
+def test_timing_headers_in_debug_mode(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.abspath('sample_project'))
+    monkeypatch.chdir('sample_project')
+    client = TestClient(api_server.create_app(no_cache=True, debug_value=True))
+    response = client.get(base_path + '/stock-price-history', params={'ticker': '0'})
+    timings = json.loads(response.headers['X-Squirrels-Timing'])
+    assert('request > database_view > fetch' in timings)
+    assert('desc="request > final_view"' in response.headers['Server-Timing'])
+
+    client = TestClient(api_server.create_app(no_cache=True, debug_value=False))
+    response = client.get(base_path + '/stock-price-history', params={'ticker': '0'})
+    assert('X-Squirrels-Timing' not in response.headers)
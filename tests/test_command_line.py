@@ -0,0 +1,26 @@
+import subprocess, sys
+
+heavy_modules = ['pandas', 'sqlalchemy', 'fastapi', 'uvicorn', 'jinja2', 'pandasql', 'git', 'inquirer', 'squirrels.parameter_configs']
+
+
+def get_imported_modules(code: str):
+    # Each line of "-X importtime" output ends with "| <indentation><module name>"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    return {line.split('|')[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time:')}
+
+
+def test_cli_import_excludes_heavy_modules():
+    imported_modules = get_imported_modules('import squirrels.command_line')
+    assert('squirrels.command_line' in imported_modules)
+    assert([x for x in heavy_modules if x in imported_modules] == [])
+
+
+def test_version_command_excludes_heavy_modules():
+    code = 'import sys; sys.argv = ["squirrels", "-V"]; from squirrels.command_line import main; main()'
+    imported_modules = get_imported_modules(code)
+    assert([x for x in heavy_modules if x in imported_modules] == [])
+
+
+def test_parameter_classes_imported_on_first_use():
+    code = 'import squirrels as sq; assert sq.SingleSelectParameter.__module__ == "squirrels.parameter_configs"'
+    assert('squirrels.parameter_configs' in get_imported_modules(code))
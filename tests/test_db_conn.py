@@ -1,10 +1,10 @@
 from squirrels.db_conn import DbConnection
-from squirrels import constants as c
+from squirrels import db_conn, constants as c, manifest as mf, timer
 import time
 
 start = time.time()
 import pandas as pd
-c.timer.add_activity_time(c.IMPORT_PANDAS, start)
+timer.add_activity_time(c.IMPORT_PANDAS, start)
 
 
 def test_get_dataframe_from_query():
@@ -12,3 +12,34 @@ def test_get_dataframe_from_query():
     df = conn.get_dataframe_from_query('SELECT 1 as col1, 2 as col2')
     df_expected = pd.DataFrame({'col1': [1], 'col2': [2]})
     assert(df.equals(df_expected))
+
+
+def test_engine_shared_across_connections():
+    conn1 = DbConnection('product_profile')
+    conn2 = DbConnection('product_profile')
+    assert(conn1.engine is conn2.engine)
+    assert('product_profile' in db_conn.get_pool_stats())
+
+
+def test_get_dataframe_chunks_from_query():
+    conn = DbConnection('product_profile')
+    query = 'SELECT 1 as col1 UNION ALL SELECT 2 UNION ALL SELECT 3'
+    chunks = list(conn.get_dataframe_chunks_from_query(query, chunk_size=2))
+    assert([len(df) for df in chunks] == [2, 1])
+    assert(pd.concat(chunks)['col1'].tolist() == [1, 2, 3])
+
+    chunks = list(conn.get_dataframe_chunks_from_query('SELECT 1 as col1 WHERE 1=0', chunk_size=2))
+    assert(len(chunks) == 1 and chunks[0].columns.tolist() == ['col1'])
+
+
+def test_get_dataframe_from_query_arrow_fetch(monkeypatch):
+    settings = {c.DB_FETCH_MODE_SETTING: c.ARROW_FETCH_MODE, c.DB_FETCH_CHUNK_SIZE_SETTING: 2}
+    monkeypatch.setitem(mf.parms, c.SETTINGS_KEY, settings)
+    conn = DbConnection('product_profile')
+    query = "SELECT NULL as col1, 'a' as col2 UNION ALL SELECT 2, 'b' UNION ALL SELECT 3, NULL"
+    df = conn.get_dataframe_from_query(query)
+    assert(df['col1'].tolist()[1:] == [2, 3])
+    assert(df['col2'].tolist() == ['a', 'b', None])
+
+    df_empty = conn.get_dataframe_from_query('SELECT 1 as col1 WHERE 1 = 0')
+    assert(list(df_empty.columns) == ['col1'] and len(df_empty) == 0)
@@ -0,0 +1,22 @@
+from squirrels import executors, constants as c
+from squirrels.executors import InstrumentedExecutor
+import time
+
+
+def test_instrumented_executor_stats():
+    executor = InstrumentedExecutor('test', max_workers=1)
+    futures = [executor.submit(time.sleep, 0.01) for _ in range(3)]
+    assert(executor.get_stats()['queued'] + executor.get_stats()['running'] > 0)
+    for future in futures:
+        future.result()
+    
+    stats = executor.get_stats()
+    assert(stats['completed'] == 3 and stats['queued'] == 0 and stats['running'] == 0)
+    assert(stats['max_wait_ms'] >= 10)
+    executor.shutdown()
+
+
+def test_get_executor_is_shared():
+    executor = executors.get_executor(c.VIEWS_EXECUTOR)
+    assert(executors.get_executor(c.VIEWS_EXECUTOR) is executor)
+    assert(c.VIEWS_EXECUTOR in executors.get_all_stats())
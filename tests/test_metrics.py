@@ -0,0 +1,25 @@
+from squirrels import metrics, executors, constants as c
+
+
+def test_histogram_collect():
+    histogram = metrics.Histogram('my_metric', 'My metric', ['name'], [1, 10])
+    histogram.observe(0.5, {'name': 'a'})
+    histogram.observe(5, {'name': 'a'})
+    histogram.observe(50, {'name': 'a "quoted"'})
+    lines = list(histogram.collect())
+    assert('my_metric_bucket{name="a",le="1.0"} 1' in lines)
+    assert('my_metric_bucket{name="a",le="10.0"} 2' in lines)
+    assert('my_metric_bucket{name="a",le="+Inf"} 2' in lines)
+    assert('my_metric_sum{name="a"} 5.5' in lines)
+    assert('my_metric_count{name="a \\"quoted\\""} 1' in lines)
+
+
+def test_span_labels_carry_into_executor_threads():
+    def get_labels():
+        with metrics.span('inner', view='view1'):
+            return metrics.get_labels()
+    
+    with metrics.span('outer', dataset='dataset1'):
+        labels = executors.get_executor(c.VIEWS_EXECUTOR).submit(get_labels).result()
+    assert(labels == {'dataset': 'dataset1', 'view': 'view1'})
+    assert(metrics.get_labels() == {})
@@ -1,4 +1,5 @@
-from squirrels import module_loader
+from squirrels import module_loader, constants as c
+import git, os, json, pytest
 
 def test_parse_module_repo_strings():
     repo_strings = [
@@ -15,3 +16,67 @@ def test_parse_module_repo_strings():
     ]
 
     assert(repos == expected)
+
+
+def create_bare_repo(tmp_path, name: str, content: str, tag: str) -> str:
+    work_path = tmp_path / f'{name}_work'
+    repo = git.Repo.init(work_path)
+    (work_path / 'file.txt').write_text(content)
+    repo.index.add(['file.txt'])
+    actor = git.Actor('test', 'test@example.com')
+    repo.index.commit('initial commit', author=actor, committer=actor)
+    repo.create_tag(tag)
+    bare_path = tmp_path / f'{name}.git'
+    git.Repo.clone_from(str(work_path), str(bare_path), bare=True)
+    return str(bare_path)
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    project_path = tmp_path / 'project'
+    project_path.mkdir()
+    monkeypatch.chdir(project_path)
+    return project_path
+
+
+def test_load_module_repos(tmp_path, project_dir, monkeypatch):
+    repo1 = create_bare_repo(tmp_path, 'repo1', 'hello', 'v1')
+    repo2 = create_bare_repo(tmp_path, 'repo2', 'world', 'v2')
+    lock = module_loader.load_module_repos([f'{repo1}@v1', f'other={repo2}@v2'])
+    assert((project_dir / 'modules' / 'repo1' / 'file.txt').read_text() == 'hello')
+    assert((project_dir / 'modules' / 'other' / 'file.txt').read_text() == 'world')
+    assert(lock['repo1']['tag'] == 'v1' and len(lock['repo1']['commit']) == 40)
+    with open(c.MODULES_LOCK_FILE, 'r') as f:
+        assert(json.load(f) == lock)
+    
+    # Unchanged modules are not cloned again, and removed modules are deleted
+    def fail_clone(*args, **kwargs):
+        raise AssertionError('should not clone')
+    monkeypatch.setattr(git.Repo, 'clone_from', fail_clone)
+    module_loader.load_module_repos([f'{repo1}@v1'])
+    assert(os.listdir('modules') == ['repo1'])
+
+    # A module loaded again (under a new name) is copied from the cache
+    module_loader.load_module_repos([f'{repo1}@v1', f'copy={repo1}@v1'])
+    assert((project_dir / 'modules' / 'copy' / 'file.txt').read_text() == 'hello')
+
+    # Editing a module does not change the cached clone it was copied from
+    (project_dir / 'modules' / 'copy' / 'file.txt').write_text('edited')
+    copy_repo = git.Repo(project_dir / 'modules' / 'copy')
+    copy_repo.index.add(['file.txt'])
+    actor = git.Actor('test', 'test@example.com')
+    copy_repo.index.commit('edit', author=actor, committer=actor)
+    module_loader.load_module_repos([f'{repo1}@v1', f'copy2={repo1}@v1'])
+    assert((project_dir / 'modules' / 'copy2' / 'file.txt').read_text() == 'hello')
+    assert(git.Repo(project_dir / 'modules' / 'copy2').head.commit.hexsha == lock['repo1']['commit'])
+
+
+def test_failed_clone_leaves_no_temp_folder(project_dir, monkeypatch):
+    def partial_clone(url, to_path, **kwargs):
+        os.makedirs(os.path.join(to_path, '.git'))
+        raise git.GitCommandError('clone', 128)
+    monkeypatch.setattr(git.Repo, 'clone_from', partial_clone)
+    with pytest.raises(git.GitCommandError):
+        module_loader.load_module_repos(['https://example.com/repo.git@v1'])
+    cache_dir = os.path.join(c.CACHE_FOLDER, 'modules')
+    assert(os.listdir(cache_dir) == [])
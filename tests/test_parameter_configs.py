@@ -117,4 +117,42 @@ def test_refresh():
     ]
     assert([x._to_dict() for x in time_of_year_parm.options] == [x._to_dict() for x in expected_time_of_year_options])
     assert(time_of_year_parm.get_selected_ids() == '13, 14, 15, 16')
-    
\ No newline at end of file
+    
+
+def test_copy():
+    parameters = ParameterSet(param_module.main())
+    parameters_copy = parameters.copy()
+    parent_parm: SingleSelectParameter = parameters_copy.get_parameter_by_name('time_unit')
+    parent_parm.set_selection('3')
+    time_of_year_parm: MultiSelectParameter = parameters_copy.get_parameter_by_name('time_of_year')
+    time_of_year_parm.refresh(parameters_copy)
+    assert(time_of_year_parm.get_selected_ids() == '13, 14, 15, 16')
+
+    original_time_of_year_parm: MultiSelectParameter = parameters.get_parameter_by_name('time_of_year')
+    assert(parameters.get_parameter_by_name('time_unit').selected_id == '0')
+    assert(original_time_of_year_parm.get_selected_ids() == '')
+    assert(original_time_of_year_parm.all_options is time_of_year_parm.all_options)
+
+
+def test_multi_select_selection():
+    options = [ParameterOption(str(i), f'Option {i}') for i in range(10)]
+    parameter = MultiSelectParameter('Multi', options)
+    parameter.set_selection('7,2,not_an_option,2')
+    assert(parameter.is_selected_id_in_options('7'))
+    assert(not parameter.is_selected_id_in_options('not_an_option'))
+    assert(parameter.selected_ids == ['7', '2', '2'])
+    assert(parameter.get_selected_ids_as_list() == ['2', '7'])
+
+
+def test_refresh_expired_datasource_params():
+    parameters = ParameterSet(param_module.main())
+    parameters._convert_datasource_params('product_profile')
+    assert(parameters._get_expired_datasource_params() == [])
+    assert(parameters._get_expired_datasource_params(default_ttl=0) == ['ticker'])
+
+    parameters._data_source_params['ticker'].refresh_ttl = 0
+    assert(parameters._get_expired_datasource_params(default_ttl=60) == ['ticker'])
+    new_parameters = parameters._with_refreshed_datasource_params('product_profile')
+    assert(new_parameters['ticker'] is not parameters['ticker'])
+    assert(new_parameters['ticker']._to_dict('ticker') == parameters['ticker']._to_dict('ticker'))
+    assert(new_parameters['time_unit'] is not parameters['time_unit'])
@@ -0,0 +1,118 @@
+from squirrels import renderer as rd, manifest as mf, constants as c
+from squirrels.results_cache import MemoryCache
+from squirrels.db_conn import DbConnection
+import pandas as pd
+import pytest, os, sys, shutil
+
+
+@pytest.fixture
+def sample_renderer(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.abspath('sample_project'))
+    monkeypatch.chdir('sample_project')
+    return rd.Renderer('stock_price_history')
+
+
+def test_render_view_reuses_compiled_template(sample_renderer: rd.Renderer):
+    sample_renderer.set_job_context()
+    view_file = 'datasets/stock_price_history/ticker_history.sql.j2'
+    sql1 = sample_renderer.render_view(view_file)
+    template = rd.get_template_env().get_template(view_file)
+    sql2 = sample_renderer.render_view(view_file)
+    assert(sql1 == sql2)
+    assert(rd.get_template_env().get_template(view_file) is template)
+
+
+def test_load_module_cached_until_file_changes(tmp_path):
+    module_path = tmp_path / 'my_view.py'
+    module_path.write_text('def main():\n    return 1\n')
+    module = rd.load_module(str(module_path))
+    assert(rd.load_module(str(module_path)) is module)
+    assert(module.main() == 1)
+
+    module_path.write_text('def main():\n    return 22\n')
+    reloaded = rd.load_module(str(module_path))
+    assert(reloaded is not module)
+    assert(reloaded.main() == 22)
+
+
+def test_load_module_with_dataclass(tmp_path):
+    module_path = tmp_path / 'context.py'
+    module_path.write_text('from __future__ import annotations\nfrom dataclasses import dataclass\n\n' + 
+                           '@dataclass\nclass Context:\n    value: int\n\ndef main():\n    return Context(1)\n')
+    module = rd.load_module(str(module_path))
+    assert(module.main().value == 1)
+    assert(module.__name__ != 'context' and sys.modules[module.__name__] is module)
+
+
+def test_warm_up_without_context_file(monkeypatch, tmp_path):
+    shutil.copytree('sample_project/datasets', tmp_path / 'datasets')
+    os.remove(tmp_path / 'datasets' / 'stock_price_history' / c.CONTEXT_FILE)
+    monkeypatch.chdir(tmp_path)
+    rd.Renderer('stock_price_history').warm_up()
+
+
+def test_failed_parameters_refresh_is_postponed(sample_renderer: rd.Renderer, monkeypatch):
+    parameters = sample_renderer.parameters.copy()
+    parameters._converted_times['ticker'] = 0
+    assert(parameters._get_expired_datasource_params(default_ttl=60) == ['ticker'])
+    
+    key = (sample_renderer.input_folder, 'stock_price_history', 'no_such_file.csv')
+    monkeypatch.setitem(rd._parameters_cache, key, parameters)
+    rd._refresh_parameters_helper(key, parameters, ['ticker'])
+    assert(rd._parameters_cache[key]._get_expired_datasource_params(default_ttl=60) == [])
+
+
+def test_database_view_cached_by_rendered_sql(sample_renderer: rd.Renderer):
+    sample_renderer.view_cache = MemoryCache(max_bytes=10**6, ttl=60)
+    conn = DbConnection('product_profile')
+    df1 = sample_renderer.get_dataframe_from_query(conn, 'product_profile', 'SELECT 1 as col1')
+    df1['col1'] = 100
+    df2 = sample_renderer.get_dataframe_from_query(conn, 'product_profile', 'SELECT 1 as col1')
+    assert(df2['col1'].tolist() == [1])
+    assert(sample_renderer.view_cache.get_stats()['hits'] == 1)
+
+
+@pytest.mark.parametrize('engine', ['sqlite', 'duckdb'])
+def test_run_final_view_from_sql(sample_renderer: rd.Renderer, monkeypatch, engine: str):
+    if engine == 'duckdb':
+        pytest.importorskip('duckdb')
+    monkeypatch.setitem(mf.parms, c.SETTINGS_KEY, {c.FINAL_VIEW_ENGINE_SETTING: engine})
+    database_views = {'view1': pd.DataFrame({'col1': [1, 2, 3], 'col2': ['a', 'b', 'c']})}
+    df = sample_renderer.run_final_view_from_sql('SELECT col2 FROM view1 WHERE col1 >= 2', database_views)
+    assert(df['col2'].tolist() == ['b', 'c'])
+
+
+def test_get_views_used_by_final_view(sample_renderer: rd.Renderer):
+    view_names = ['view1', 'view2', 'view10']
+    assert(sample_renderer.get_views_used_by_final_view(view_names, 'view2') == ['view2'])
+    assert(sample_renderer.get_views_used_by_final_view(view_names, 'final_view.py') == view_names)
+    final_view_sql_str = 'SELECT * FROM VIEW1 JOIN view10 USING (id)'
+    assert(sample_renderer.get_views_used_by_final_view(view_names, 'final_view.sql.j2', final_view_sql_str) == ['view1', 'view10'])
+
+
+def test_serialize_dataframe_round_trip():
+    df = pd.DataFrame({'col1': [1, 2, 3], 'col2': ['a', 'b', None]})
+    pd.testing.assert_frame_equal(rd.deserialize_dataframe(rd.serialize_dataframe(df)), df)
+
+
+def test_python_view_in_process_reloads_refreshed_parameters(sample_renderer: rd.Renderer, monkeypatch):
+    key = (sample_renderer.input_folder, 'stock_price_history', None)
+    monkeypatch.setattr(rd, '_worker_parameters_versions', {})
+    database_views = {'ticker_history': pd.DataFrame({'date': ['2023-01-03'], 'close': [125.07]})}
+    serialized_views = {k: rd.serialize_dataframe(v) for k, v in database_views.items()}
+    
+    rd._run_python_view_in_process('stock_price_history', None, {}, 0, 'final_view.py', serialized_views)
+    parameters = rd._parameters_cache[key]
+    rd._run_python_view_in_process('stock_price_history', None, {}, 0, 'final_view.py', serialized_views)
+    assert(rd._parameters_cache[key] is parameters)
+
+    # The server process refreshed the parameters, so the worker rebuilds its own
+    rd._run_python_view_in_process('stock_price_history', None, {}, 1, 'final_view.py', serialized_views)
+    assert(rd._parameters_cache[key] is not parameters)
+
+
+def test_run_final_view_from_python_in_process_pool(sample_renderer: rd.Renderer, monkeypatch):
+    monkeypatch.setitem(mf.parms, c.SETTINGS_KEY, {c.FINAL_VIEW_EXECUTION_SETTING: c.PROCESS_EXECUTION})
+    database_views = {'ticker_history': pd.DataFrame({'date': ['2023-01-03'], 'close': [125.07]})}
+    df = sample_renderer.run_final_view_from_python('final_view.py', database_views)
+    pd.testing.assert_frame_equal(df, database_views['ticker_history'])
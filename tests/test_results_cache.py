@@ -0,0 +1,49 @@
+from squirrels import results_cache as rc, manifest as mf, constants as c
+import pandas as pd, pytest
+
+
+def test_memory_cache_evicts_by_size():
+    df = pd.DataFrame({'col1': range(100)})
+    size = rc.get_size_in_bytes(df)
+    cache = rc.MemoryCache(max_bytes=size*2, ttl=60)
+    cache.set(('dataset', 1), df)
+    cache.set(('dataset', 2), df)
+    cache.set(('dataset', 3), df)
+    assert(cache.get(('dataset', 1)) is None)
+    assert(cache.get(('dataset', 3)) is df)
+    assert(cache.get_stats()['bytes'] == size*2)
+    
+    cache.set(('dataset', 4), pd.DataFrame({'col1': range(1000)}))
+    assert(cache.get(('dataset', 4)) is None)
+
+
+def test_key_digest_ignores_frozenset_order():
+    key1 = ('dataset', frozenset([('a', '1'), ('b', '2')]))
+    key2 = ('dataset', frozenset([('b', '2'), ('a', '1')]))
+    assert(rc.get_key_digest(key1) == rc.get_key_digest(key2))
+
+
+def test_disk_cache(tmp_path):
+    cache = rc.DiskCache(str(tmp_path), max_bytes=10**6, ttl=60)
+    key = ('dataset', frozenset([('a', '1')]))
+    df = pd.DataFrame({'col1': [1, 2], 'col2': ['x', 'y']})
+    assert(cache.get(key) is None)
+    cache.set(key, df)
+    assert(cache.get(key).equals(df))
+    
+    other_process_cache = rc.DiskCache(str(tmp_path), max_bytes=10**6, ttl=60)
+    assert(other_process_cache.get(key).equals(df))
+    
+    expired_cache = rc.DiskCache(str(tmp_path), max_bytes=10**6, ttl=-1)
+    assert(expired_cache.get(key) is None)
+    assert(cache.get_stats()['entries'] == 0)
+
+
+def test_deprecated_cache_size_setting_limits_entries(monkeypatch):
+    monkeypatch.setitem(mf.parms, c.SETTINGS_KEY, {c.RESULTS_CACHE_SIZE_SETTING: 2})
+    with pytest.warns(FutureWarning, match=c.RESULTS_CACHE_MAX_BYTES_SETTING):
+        cache = rc.create_results_cache(ttl=60)
+    for i in range(3):
+        cache.set(('dataset', i), pd.DataFrame({'col1': [i]}))
+    assert(cache.get(('dataset', 0)) is None)
+    assert(cache.get_stats()['entries'] == 2)
@@ -0,0 +1,23 @@
+from squirrels.single_flight import SingleFlight
+import asyncio
+
+
+def test_concurrent_calls_coalesced():
+    single_flight = SingleFlight()
+    num_runs = 0
+
+    async def compute():
+        nonlocal num_runs
+        num_runs += 1
+        await asyncio.sleep(0.01)
+        return 'result'
+    
+    async def run_all():
+        calls = [single_flight.run(('dataset', 'params'), compute) for _ in range(5)]
+        calls.append(single_flight.run(('dataset', 'other_params'), compute))
+        return await asyncio.gather(*calls)
+    
+    results = asyncio.run(run_all())
+    assert(results == ['result'] * 6)
+    assert(num_runs == 2)
+    assert(single_flight.get_stats() == {'requests': 6, 'coalesced': 4, 'in_flight': 0})
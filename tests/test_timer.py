@@ -0,0 +1,29 @@
+from squirrels import timer, executors, constants as c
+import time
+
+
+def test_nested_spans_and_percentiles():
+    with timer.new_timer() as my_timer:
+        with timer.span('outer'):
+            for _ in range(10):
+                with timer.span('inner'):
+                    pass
+        timer.add_activity_time('other', time.time())
+    
+    summary = my_timer.get_summary()
+    assert(set(summary) == {'outer', 'outer > inner', 'other'})
+    assert(summary['outer > inner']['count'] == 10)
+    assert(summary['outer > inner']['p50_ms'] <= summary['outer > inner']['max_ms'] <= summary['outer']['total_ms'])
+    assert(timer.get_timer() is not my_timer)
+
+
+def test_timer_shared_by_executor_threads():
+    def run_activity(i):
+        with timer.span('activity'):
+            return i
+    
+    with timer.new_timer() as my_timer:
+        with timer.span('parent'):
+            list(executors.get_executor(c.VIEWS_EXECUTOR).map(run_activity, range(20)))
+    assert(my_timer.get_summary()['parent > activity']['count'] == 20)
+    assert('desc="parent > activity"' in my_timer.get_server_timing())
@@ -0,0 +1,25 @@
+from squirrels.view_scheduler import ViewScheduler
+import concurrent.futures, time, pytest
+
+
+def test_run_in_dependency_order():
+    scheduler = ViewScheduler({'a': [], 'b': ['a'], 'c': ['a', 'b'], 'unused': []})
+    
+    def run_view(view_name, upstream_results):
+        time.sleep(0.01)
+        return view_name + '(' + ','.join(upstream_results[x] for x in sorted(upstream_results)) + ')'
+    
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        results = scheduler.run(run_view, ['c'], executor)
+    
+    assert(results == {'a': 'a()', 'b': 'b(a())', 'c': 'c(a(),b(a()))'})
+    critical_path, total_time = scheduler.get_critical_path()
+    assert(critical_path == ['a', 'b', 'c'])
+    assert(total_time >= 0.03)
+
+
+def test_invalid_dependencies():
+    with pytest.raises(ValueError):
+        ViewScheduler({'a': ['not_a_view']})
+    with pytest.raises(ValueError):
+        ViewScheduler({'a': ['c'], 'b': ['a'], 'c': ['b']})